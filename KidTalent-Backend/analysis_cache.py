@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+
+
+# Cache kết quả phân tích tài năng (Talent_profile) theo phiên chat.
+# Khóa = (session_id, tuổi, dấu vân tay của transcript) nên khi bé nhắn thêm
+# tin mới thì khóa cũ tự động không còn khớp. Dọn bộ nhớ bằng TTL + LRU.
+class AnalysisCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 1800):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (hết hạn lúc, profile)
+        self._keys_by_session = {}     # session_id -> {key, ...}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, session_id: str, age: int, fingerprint: str):
+        key = (session_id, age, fingerprint)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return profile
+
+    def put(self, session_id: str, age: int, fingerprint: str, profile):
+        key = (session_id, age, fingerprint)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, profile)
+        self._entries.move_to_end(key)
+        self._keys_by_session.setdefault(session_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        # Gọi khi phiên có tin nhắn mới: các kết quả cũ không còn dùng được nữa
+        keys = self._keys_by_session.pop(session_id, None)
+        if not keys:
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+        self.invalidations += len(keys)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        session_keys = self._keys_by_session.get(key[0])
+        if session_keys is not None:
+            session_keys.discard(key)
+            if not session_keys:
+                del self._keys_by_session[key[0]]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
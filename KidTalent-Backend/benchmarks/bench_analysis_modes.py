@@ -0,0 +1,114 @@
+"""
+So sánh các chế độ phân tích (ANALYSIS_MODE): verbose / compact / structured.
+
+Mỗi chế độ chạy cùng 1 bộ hội thoại mẫu, đo:
+  - số token prompt trung bình (kể cả schema gửi kèm ở chế độ structured)
+  - thời gian xử lý phía backend mỗi lần phân tích (LLM giả trả lời tức thì -> chỉ còn overhead)
+  - tỉ lệ parse được ngay lần đầu và tỉ lệ thành công sau khi sửa JSON
+Thêm: chi phí dựng lại chain cho mỗi request (cách làm cũ) so với dùng chain dựng sẵn.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_analysis_modes --requests 50 --malformed-rate 0.1
+    python -m benchmarks.bench_analysis_modes --live --requests 5   # gọi Gemini thật (cần GOOGLE_API_KEY)
+"""
+import argparse
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from benchmarks.fake_llm import CANNED_CHAT_REPLY, load_backend
+from benchmarks.load_test import KID_MESSAGES
+
+
+def prompt_tokens(backend, pipeline="analysis"):
+    for metric in backend.REGISTRY.collect():
+        if metric.name != "kidtalent_llm_tokens":
+            continue
+        for sample in metric.samples:
+            if (sample.name.endswith("_total") and sample.labels["pipeline"] == pipeline
+                    and sample.labels["kind"] == "prompt"):
+                return sample.value
+    return 0.0
+
+
+def seed_transcripts(backend, prefix, count, turns):
+    texts = []
+    for n in range(count):
+        session_id = f"{prefix}-{n}"
+        history = backend.session_store.get_session_history(session_id)
+        for t in range(turns):
+            history.add_messages([
+                HumanMessage(content=KID_MESSAGES[(n + t) % len(KID_MESSAGES)]),
+                AIMessage(content=CANNED_CHAT_REPLY),
+            ])
+        texts.append(backend.transcripts.get(session_id, *history.messages_with_ids()).text)
+    return texts
+
+
+async def run_mode(backend, mode, texts):
+    backend.ai.use_analysis_mode(mode)
+    backend.ai.analysis_chain  # Dựng sẵn (như warm-up lúc khởi động)
+    repairer = backend.output_repairer
+    before = dict(repairer.stats())
+    tokens_before = prompt_tokens(backend)
+
+    ok = 0
+    started = time.perf_counter()
+    for text in texts:
+        try:
+            await backend.analyze_transcript({"age": 8, "chat_history": text}, config=backend.run_config("analysis"))
+            ok += 1
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - started
+
+    after = repairer.stats()
+    return {
+        "mode": mode,
+        "prompt_tokens": (prompt_tokens(backend) - tokens_before) / len(texts),
+        "ms_per_request": elapsed / len(texts) * 1000,
+        "first_try": (after["parsed"] - before["parsed"]) / len(texts),
+        "success": ok / len(texts),
+        "repairs": after["llm_repairs"] - before["llm_repairs"] + after["local_repairs"] - before["local_repairs"],
+    }
+
+
+def chain_build_cost(backend, rounds=2000):
+    # Cách làm cũ: mỗi request dựng lại analysis_prompt | llm | parser
+    analysis_prompt, _ = backend.ANALYSIS_PROMPTS["verbose"]
+    llm = backend.ai.llm
+    started = time.perf_counter()
+    for _ in range(rounds):
+        analysis_prompt | llm | StrOutputParser()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+async def main_async(args):
+    if args.live:
+        import main as backend
+    else:
+        backend, _ = load_backend(latency=0, malformed_rate=args.malformed_rate, seed=11)
+
+    print(f"{'chế độ':<12}{'token prompt':>14}{'ms/request':>12}{'parse ngay':>12}{'thành công':>12}{'lần sửa':>9}")
+    for mode in args.modes.split(","):
+        texts = seed_transcripts(backend, f"mode-{mode}", args.requests, args.turns)
+        r = await run_mode(backend, mode, texts)
+        print(f"{r['mode']:<12}{r['prompt_tokens']:>14.0f}{r['ms_per_request']:>12.2f}"
+              f"{r['first_try']:>12.0%}{r['success']:>12.0%}{r['repairs']:>9}")
+    print(f"\nDựng lại chain mỗi request (cách cũ): {chain_build_cost(backend):.0f} µs/request; chain dựng sẵn: 0 µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=6, help="Số lượt chat của mỗi hội thoại mẫu")
+    parser.add_argument("--modes", default="verbose,compact,structured")
+    parser.add_argument("--malformed-rate", type=float, default=0.1, help="Tỉ lệ JSON hỏng của LLM giả")
+    parser.add_argument("--live", action="store_true", help="Dùng Gemini thật thay cho LLM giả")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+So sánh phân tích cả lớp: N lần gọi /analyze tuần tự so với 1 lần /analyze/batch,
+dùng LLM giả có độ trễ cố định (không cần mạng).
+Thời gian của batch nên gần max(latency) thay vì sum(latency).
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_batch --children 20 --latency 0.5 --output zip
+"""
+import argparse
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fake_llm import load_backend
+
+
+def seed_sessions(backend, children: int):
+    for c in range(children):
+        history = backend.get_session_history(f"class-{c}")
+        history.add_messages([
+            HumanMessage(content=f"Con tên là bé số {c}, con thích vẽ và đá bóng"),
+            AIMessage(content="Ồ hay quá! Nhóc thích vẽ gì nhất?"),
+            HumanMessage(content="Con thích vẽ khủng long và tàu vũ trụ"),
+            AIMessage(content="Tuyệt vời! Thám tử cũng mê khủng long lắm."),
+        ])
+
+
+async def run(app, children: int, output):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        for c in range(children):
+            r = await client.post("/analyze", json={"session_id": f"class-{c}", "child_age": 8})
+            assert "error" not in r.json(), r.json()
+        sequential = time.perf_counter() - start
+
+        # Tuổi khác -> không trúng Cache của vòng tuần tự
+        items = [{"session_id": f"class-{c}", "child_age": 9, "child_name": f"Bé {c}"} for c in range(children)]
+        items.append({"session_id": "khong-ton-tai", "child_age": 9})  # 1 bé lỗi không làm hỏng cả lớp
+        start = time.perf_counter()
+        r = await client.post("/analyze/batch", json={"items": items, "output": output})
+        batch = time.perf_counter() - start
+        r.raise_for_status()
+        if output:
+            summary = f"{r.headers['content-type']}, {len(r.content)} bytes, failed={r.headers['x-batch-failed']}"
+        else:
+            body = r.json()
+            summary = f"succeeded={body['succeeded']}, failed={body['failed']}"
+        return sequential, batch, summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--children", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--output", choices=["pdf", "zip"], default=None)
+    args = ap.parse_args()
+
+    backend, _ = load_backend(latency=args.latency)
+
+    seed_sessions(backend, args.children)
+    sequential, batch, summary = asyncio.run(run(backend.app, args.children, args.output))
+    print(f"sequential /analyze x{args.children}: {sequential:6.2f} s  (sum of latencies ~ {args.children * args.latency:.2f} s)")
+    print(f"/analyze/batch            : {batch:6.2f} s  ({summary})")
+
+
+if __name__ == "__main__":
+    main()
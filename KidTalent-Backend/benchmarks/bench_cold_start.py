@@ -0,0 +1,66 @@
+"""
+Đo khởi động nguội (cold start) của backend trong một tiến trình Python mới:
+  - import_ms: thời gian `import main` (không tạo LLM, không import langchain_google_genai)
+  - ready_ms: từ lúc bắt đầu lifespan tới khi /ready trả 200 (warm-up chạy nền)
+  - first_request_ms: request /chat đầu tiên sau khi ready (LLM giả, không cần mạng)
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_cold_start --runs 3
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Chạy trong tiến trình con để mọi module đều được import lại từ đầu
+CHILD = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+from benchmarks.fake_llm import load_backend
+backend, _ = load_backend(latency=0.05)
+import_ms = (time.perf_counter() - t0) * 1000
+
+async def run():
+    import httpx
+    transport = httpx.ASGITransport(app=backend.app)
+    async with backend.app.router.lifespan_context(backend.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            t1 = time.perf_counter()
+            not_ready = 0
+            while (await client.get("/ready")).status_code != 200:
+                not_ready += 1
+                if backend.startup_state["error"]:
+                    raise SystemExit(backend.startup_state["error"])
+                await asyncio.sleep(0.01)
+            ready_ms = (time.perf_counter() - t1) * 1000
+            t2 = time.perf_counter()
+            r = await client.post("/chat", json={"session_id": "cold", "user_message": "Con thích vẽ", "child_age": 8})
+            r.raise_for_status()
+            first_ms = (time.perf_counter() - t2) * 1000
+    print(json.dumps({"import_ms": import_ms, "ready_ms": ready_ms, "first_request_ms": first_ms,
+                      "probes_before_ready": not_ready, "warm_up_ms": backend.startup_state["warm_up_ms"]}))
+
+asyncio.run(run())
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'chỉ số':<20}{'trung vị (ms)':>16}{'tối đa (ms)':>14}")
+    for key in ("import_ms", "ready_ms", "warm_up_ms", "first_request_ms"):
+        values = [r[key] for r in results]
+        print(f"{key:<20}{statistics.median(values):>16.1f}{max(values):>14.1f}")
+    print(f"/ready trả 503 trước khi sẵn sàng: {[r['probes_before_ready'] for r in results]} lần")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Load test cho /chat với LLM giả có độ trễ cố định.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_concurrency --requests 32 --latency 0.5 --limits 1,4,16
+
+Nếu handler còn chặn event loop, thông lượng sẽ đứng yên ~1/latency req/s
+bất kể giới hạn song song. Với ainvoke, thông lượng tăng theo giới hạn.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_llm import load_backend
+
+
+async def run_round(app, n_requests: int):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            payload = {"session_id": f"bench-{i}", "user_message": "Con thích vẽ", "child_age": 8}
+            r = await client.post("/chat", json=payload)
+            r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=32)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--limits", default="1,4,16")
+    args = ap.parse_args()
+
+    backend, _ = load_backend(latency=args.latency)
+    from concurrency import LLMLimiter
+
+    print(f"{'limit':>6} {'wall(s)':>9} {'req/s':>8}")
+    for limit in [int(x) for x in args.limits.split(",")]:
+        backend.llm_limiter = LLMLimiter(limit)
+        wall = asyncio.run(run_round(backend.app, args.requests))
+        print(f"{limit:>6} {wall:>9.2f} {args.requests / wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Đo bộ nhớ khi xuất dữ liệu (export.py) với số phiên tăng dần trên kho SQLite.
+
+So sánh: dựng cả danh sách rồi json.dumps (cách "đọc hết vào RAM") với generator theo trang
+(iter_ndjson). Bộ nhớ đỉnh đo bằng tracemalloc; kỳ vọng: generator giữ nguyên dù 1k hay 100k phiên.
+Sau đó thử xuất tăng dần: chỉ các phiên vừa có tin nhắn mới.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_export --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from benchmarks.load_test import KID_MESSAGES
+from export import export_records, iter_ndjson
+from session_store import SQLiteSessionStore
+
+PROFILE = {
+    "summary": "Bé thích vẽ và khám phá vũ trụ",
+    "dominant_intelligence": "Không gian - thị giác",
+    "personality_traits": ["Sáng tạo", "Tò mò", "Kiên nhẫn"],
+    "suggested_careers": ["Kiến trúc sư", "Họa sĩ", "Kỹ sư hàng không"],
+    "advice_for_parents": "Cho bé tham gia lớp vẽ và đọc sách khoa học.",
+}
+
+
+def seed(store, start, count, turns):
+    # Ghi thẳng bằng SQL trong 1 transaction (nhanh hơn append_messages từng phiên khi tạo 100k phiên)
+    now = time.time()
+    sessions, messages, profiles = [], [], []
+    for n in range(start, start + count):
+        session_id = f"kid-{n}"
+        sessions.append((session_id, now, turns * 2, n + 1, now))
+        for t in range(turns):
+            for m in (HumanMessage(content=KID_MESSAGES[(n + t) % len(KID_MESSAGES)]),
+                      AIMessage(content="Hay quá! Kể thêm cho Thám tử nghe nào.")):
+                messages.append((session_id, m.type, len(m.content), json.dumps(message_to_dict(m), ensure_ascii=False)))
+        if n % 2 == 0:
+            profiles.append((session_id, 8, json.dumps(PROFILE, ensure_ascii=False), now))
+    conn = store._conn
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO sessions(session_id, last_active, message_count, change_seq, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?)", sessions)
+    conn.executemany("INSERT INTO messages(session_id, type, chars, data) VALUES (?, ?, ?, ?)", messages)
+    conn.executemany("INSERT INTO profiles(session_id, child_age, data, analyzed_at) VALUES (?, ?, ?, ?)", profiles)
+    conn.execute("UPDATE change_counter SET value = MAX(value, ?) WHERE id = 1", (start + count,))
+    conn.execute("COMMIT")
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    written = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return written, elapsed, peak
+
+
+def export_streaming(store, compress):
+    return sum(len(chunk) for chunk in iter_ndjson(export_records(store), compress=compress))
+
+
+def export_in_memory(store):
+    records = list(export_records(store))
+    return len("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--naive-limit", type=int, default=10000,
+                        help="Chỉ chạy cách đọc hết vào RAM tới số phiên này")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteSessionStore(os.path.join(tmp, "sessions.db"), max_sessions=max(args.sizes))
+        print(f"{'phiên':>8}{'cách xuất':>18}{'MB ra':>9}{'giây':>8}{'RAM đỉnh (KB)':>16}")
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed(store, seeded, size - seeded, args.turns)
+            seeded = size
+            runs = [("generator", lambda: export_streaming(store, False)),
+                    ("generator + gzip", lambda: export_streaming(store, True))]
+            if size <= args.naive_limit:
+                runs.insert(0, ("đọc hết vào RAM", lambda: export_in_memory(store)))
+            for name, fn in runs:
+                written, elapsed, peak = measure(fn)
+                print(f"{size:>8}{name:>18}{written / 1e6:>9.1f}{elapsed:>8.2f}{peak / 1024:>16.0f}")
+
+        # Xuất tăng dần: 100 bé nhắn thêm -> lần xuất sau chỉ có 100 dòng
+        cursor = store.export_cursor()
+        for n in range(100):
+            store.append_messages(f"kid-{n * 7}", [HumanMessage(content="Con vừa vẽ xong bức tranh mới")])
+        started = time.perf_counter()
+        changed = sum(1 for _ in export_records(store, since=cursor))
+        print(f"\nXuất tăng dần sau con trỏ {cursor}: {changed} phiên, "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms (con trỏ mới {store.export_cursor()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Tạo nhiều báo cáo PDF cùng lúc qua PdfRenderPool với các kích thước pool khác
+nhau, đồng thời đo độ trễ của event loop (tick mỗi 10ms) trong lúc render.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_pdf_pool --reports 40 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_llm import CANNED_PROFILE
+from pdf_pool import PdfRenderPool
+from report_generator import warm_up_report_engine
+
+
+async def run_round(pool: PdfRenderPool, n_reports: int):
+    data = dict(CANNED_PROFILE, child_name="Bé Bi", age=8)
+    await pool.render(data)  # Khởi động các worker trước khi đo
+
+    worst_tick = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst_tick
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst_tick = max(worst_tick, time.perf_counter() - start - 0.01)
+
+    tick_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(pool.render(data) for _ in range(n_reports)))
+    wall = time.perf_counter() - start
+    done = True
+    await tick_task
+    return wall, worst_tick
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reports", type=int, default=40)
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--kind", default="process", choices=["process", "thread"])
+    args = ap.parse_args()
+
+    warm_up_report_engine()
+    print(f"{'workers':>8} {'wall(s)':>8} {'reports/s':>10} {'max loop stall(ms)':>19}")
+    for workers in [int(x) for x in args.workers.split(",")]:
+        pool = PdfRenderPool(max_workers=workers, max_pending=args.reports, kind=args.kind)
+        try:
+            wall, stall = asyncio.run(run_round(pool, args.reports))
+        finally:
+            pool.shutdown()
+        print(f"{workers:>8} {wall:>8.2f} {args.reports / wall:>10.1f} {stall * 1000:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
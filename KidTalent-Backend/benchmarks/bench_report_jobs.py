@@ -0,0 +1,104 @@
+"""
+So sánh /report (đồng bộ: giữ kết nối suốt phân tích + render) với job nền /reports
+(POST trả job_id ngay, hỏi trạng thái, tải PDF từ đĩa với Content-Length/ETag). LLM giả, không cần mạng.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_report_jobs --kids 30 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.load_test import KID_MESSAGES, percentile
+
+
+def seed(backend, prefix, kids):
+    for n in range(kids):
+        history = backend.get_session_history(f"{prefix}-{n}")
+        for t in range(3):
+            history.add_messages([HumanMessage(content=KID_MESSAGES[(n + t) % len(KID_MESSAGES)]),
+                                  AIMessage(content="Hay quá! Kể thêm cho Thám tử nghe nào.")])
+
+
+async def main_async(args):
+    import httpx
+
+    os.environ["REPORT_CACHE_DIR"] = tempfile.mkdtemp(prefix="kidtalent-reports-")
+    from benchmarks.fake_llm import load_backend
+
+    backend, _ = load_backend(latency=args.latency)
+    seed(backend, "sync", args.kids)
+    seed(backend, "job", args.kids)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with backend.app.router.lifespan_context(backend.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # 1. Cách cũ: mỗi request giữ kết nối tới khi có PDF
+            start = time.perf_counter()
+            held = await asyncio.gather(*(
+                client.post("/report", json={"session_id": f"sync-{n}", "child_age": 8}) for n in range(args.kids)
+            ))
+            sync_wall = time.perf_counter() - start
+            sync_ok = sum(1 for r in held if r.status_code == 200)
+
+            # 2. Job nền: gửi hết, hỏi trạng thái định kỳ, tải khi xong
+            submit_latencies = []
+
+            async def submit(n):
+                t = time.perf_counter()
+                r = await client.post("/reports", json={"session_id": f"job-{n}", "child_age": 8,
+                                                        "child_name": f"Bé {n}"})
+                submit_latencies.append(time.perf_counter() - t)
+                return r.json()["job_id"]
+
+            start = time.perf_counter()
+            job_ids = await asyncio.gather(*(submit(n) for n in range(args.kids)))
+            pending = set(job_ids)
+            polls = 0
+            while pending:
+                await asyncio.sleep(args.poll_interval)
+                for job_id in list(pending):
+                    polls += 1
+                    status = (await client.get(f"/reports/{job_id}")).json()["status"]
+                    if status in ("done", "failed"):
+                        pending.discard(job_id)
+            jobs_wall = time.perf_counter() - start
+
+            r = await client.get(f"/reports/{job_ids[0]}/pdf")
+            again = await client.get(f"/reports/{job_ids[0]}/pdf", headers={"If-None-Match": r.headers["etag"]})
+            resubmit = await client.post("/reports", json={"session_id": "job-0", "child_age": 8, "child_name": "Bé 0"})
+
+            # Tên có ký tự markup (<, &) vẫn phải ra PDF, không thành job lỗi
+            markup = (await client.post("/reports", json={"session_id": "job-1", "child_age": 8,
+                                                          "child_name": "An <b> & Bo"})).json()
+            while markup["status"] in ("queued", "running"):
+                await asyncio.sleep(args.poll_interval)
+                markup = (await client.get(markup["status_url"])).json()
+
+    print(f"/report đồng bộ   : {sync_ok}/{args.kids} PDF sau {sync_wall:.2f}s, "
+          f"mỗi kết nối bị giữ trung bình {sum(r.elapsed.total_seconds() for r in held) / len(held):.2f}s")
+    print(f"/reports (job nền): POST p50 {percentile(submit_latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(submit_latencies, 95) * 1000:.1f} ms; tất cả xong sau {jobs_wall:.2f}s ({polls} lần hỏi)")
+    print(f"Tải PDF: {r.status_code}, Content-Length={r.headers.get('content-length')}, ETag={r.headers.get('etag')}; "
+          f"tải lại với If-None-Match -> {again.status_code}")
+    print(f"Gửi lại job cùng nội dung -> {resubmit.json()['status']} ngay (PDF lấy từ đĩa)")
+    print(f"Tên có markup 'An <b> & Bo' -> {markup['status']}" + (f" ({markup['error']})" if markup["error"] else ""))
+    print(f"report_jobs: {backend.report_jobs.stats()}")
+    if markup["status"] != "done":
+        raise SystemExit("Job với tên có markup bị lỗi")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kids", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.5, help="Độ trễ giả lập của Gemini (giây)")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Đo thời gian tạo 1 báo cáo PDF: cách cũ (tìm + đăng ký font, dựng lại styles
+cho mỗi báo cáo) so với ReportEngine dùng lại font/styles đã chuẩn bị sẵn.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_report_render --reports 50
+"""
+import argparse
+import io
+import time
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from benchmarks.fake_llm import CANNED_PROFILE
+import report_generator
+from report_generator import FONT_NAME, FONT_PATH, ReportEngine
+
+
+def legacy_render(data):
+    # Tái hiện create_talent_pdf cũ: kiểm tra file font, parse lại TTF, dựng lại styles
+    report_generator._font_file_ok(FONT_PATH)
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+    ReportEngine(FONT_NAME).render(io.BytesIO(), data)
+
+
+def timed(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reports", type=int, default=50)
+    args = ap.parse_args()
+
+    data = dict(CANNED_PROFILE, child_name="Bé Bi", age=8)
+    engine = report_generator.warm_up_report_engine()
+
+    legacy_ms = timed(lambda: legacy_render(data), args.reports)
+    engine_ms = timed(lambda: engine.render(io.BytesIO(), data), args.reports)
+    print(f"per report, legacy (font + styles each time): {legacy_ms:7.2f} ms")
+    print(f"per report, warm ReportEngine               : {engine_ms:7.2f} ms")
+    print(f"speed-up: {legacy_ms / engine_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
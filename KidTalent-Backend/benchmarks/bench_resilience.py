@@ -0,0 +1,116 @@
+"""
+Thử lớp gọi LLM "bền" (resilience.py) với LLM giả có gây lỗi, không cần mạng:
+
+  flaky     : 30% lời gọi lỗi 503 -> tỉ lệ thành công khi có / không có thử lại
+  hang      : 20% lời gọi bị treo 30s -> deadline giữ độ trễ tối đa ở mức vài giây
+  outage    : Gemini sập hẳn -> cầu dao mở, request sau trả 503 ngay thay vì chờ thử lại
+  malformed : 50% JSON phân tích bị cụt -> sửa từ câu trả lời cũ (prompt ngắn) thay vì phân tích lại
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_resilience --requests 40
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_llm import FakeGeminiChat, load_backend
+from benchmarks.load_test import KID_MESSAGES, percentile
+from resilience import CircuitBreaker, ResilientCaller
+
+
+def configure(backend, llm_kwargs, timeout=2.0, max_attempts=3, breaker_failures=5):
+    # Mỗi kịch bản dùng LLM giả và lớp resilience mới (main tra cứu llm_caller lúc chạy)
+    fake = FakeGeminiChat(seed=7, **llm_kwargs)
+    backend.ai.use_llm(fake)
+    backend.llm_caller = ResilientCaller(
+        CircuitBreaker(breaker_failures, reset_timeout=30),
+        timeout=timeout, max_attempts=max_attempts, base_delay=0.05, max_delay=0.5,
+    )
+    return fake
+
+
+async def fire_chats(client, prefix, n, concurrency=8):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, codes = [], []
+
+    async def one(i):
+        async with slots:
+            start = time.perf_counter()
+            r = await client.post("/chat", json={
+                "session_id": f"{prefix}-{i}", "user_message": KID_MESSAGES[i % len(KID_MESSAGES)], "child_age": 8,
+            })
+            latencies.append(time.perf_counter() - start)
+            codes.append(r.status_code)
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies, codes
+
+
+def report(name, latencies, codes, backend, fake):
+    ok = sum(1 for c in codes if c == 200)
+    stats = backend.llm_caller.stats()
+    print(f"{name:<26}{ok:>4}/{len(codes):<4}{percentile(latencies, 50) * 1000:>9.0f}"
+          f"{percentile(latencies, 95) * 1000:>9.0f}{max(latencies) * 1000:>9.0f}"
+          f"{stats['retries']:>9}{backend.llm_caller.breaker.rejected:>9}{fake.counts['calls']:>10}")
+
+
+async def main_async(args):
+    import httpx
+
+    backend, _ = load_backend()
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'kịch bản':<26}{'ok':>9}{'p50(ms)':>9}{'p95(ms)':>9}{'max(ms)':>9}"
+              f"{'thử lại':>9}{'chặn':>9}{'gọi LLM':>10}")
+
+        for attempts in (1, 3):
+            fake = configure(backend, {"latency": args.latency, "failure_rate": 0.3},
+                             max_attempts=attempts, breaker_failures=1000)
+            lat, codes = await fire_chats(client, f"flaky{attempts}", args.requests)
+            report(f"flaky, {attempts} lần thử", lat, codes, backend, fake)
+
+        fake = configure(backend, {"latency": args.latency, "hang_rate": 0.2, "hang_seconds": 30},
+                         timeout=1.0, breaker_failures=1000)
+        lat, codes = await fire_chats(client, "hang", args.requests)
+        report("hang 30s, deadline 1s", lat, codes, backend, fake)
+
+        for failures, label in ((1000, "không cầu dao"), (5, "cầu dao 5 lỗi")):
+            fake = configure(backend, {"latency": args.latency, "fail_first": 10 ** 6}, breaker_failures=failures)
+            lat, codes = await fire_chats(client, f"outage{failures}", args.requests, concurrency=2)
+            report(f"outage, {label}", lat, codes, backend, fake)
+
+        # JSON hỏng: mỗi bé chat vài lượt rồi /analyze
+        fake = configure(backend, {"latency": args.latency, "malformed_rate": 0.5})
+        for _ in range(args.turns):
+            await fire_chats(client, "parse", args.requests)
+        before = dict(fake.counts)
+        results = await asyncio.gather(*(
+            client.post("/analyze", json={"session_id": f"parse-{i}", "child_age": 8}) for i in range(args.requests)
+        ))
+        ok = sum(1 for r in results if r.status_code == 200 and "error" not in r.json())
+        calls = fake.counts["calls"] - before["calls"]
+        print(f"\nmalformed: {ok}/{args.requests} phân tích thành công, {calls} lời gọi LLM "
+              f"({fake.counts['malformed']} JSON hỏng, {fake.counts['repairs']} lần sửa bằng prompt ngắn)")
+        print(f"parse: {backend.output_repairer.stats()}")
+        tokens = {}
+        for metric in backend.REGISTRY.collect():
+            if metric.name == "kidtalent_llm_tokens":
+                for sample in metric.samples:
+                    if sample.labels["kind"] == "prompt" and sample.name.endswith("_total"):
+                        tokens[sample.labels["pipeline"]] = sample.value
+        if tokens.get("analysis_repair") and fake.counts["repairs"]:
+            analysis_calls = calls - fake.counts["repairs"]
+            print(f"token prompt trung bình: phân tích {tokens['analysis'] / analysis_calls:.0f}, "
+                  f"sửa JSON {tokens['analysis_repair'] / fake.counts['repairs']:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.1, help="Độ trễ giả lập của Gemini (giây)")
+    parser.add_argument("--turns", type=int, default=6, help="Số lượt chat trước khi phân tích (kịch bản malformed)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
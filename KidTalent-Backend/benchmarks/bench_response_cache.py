@@ -0,0 +1,103 @@
+"""
+Đo hiệu quả của response cache với các câu mở đầu hay gặp (LLM giả, không cần mạng).
+
+Mỗi bé chat vài lượt đầu: phần lớn mở đầu bằng vài câu quen thuộc ("Chào", "Con 8 tuổi"...),
+một phần gõ câu riêng. So sánh số lời gọi Gemini, tỉ lệ hit và độ trễ khi bật / tắt cache,
+và thử tầng SQLite: "worker" thứ 2 (RAM trống) vẫn hit nhờ dữ liệu worker 1 đã ghi.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_response_cache --kids 200 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_llm import load_backend
+from benchmarks.load_test import percentile
+from response_cache import ResponseCache
+
+OPENERS = ["Chào", "chào thám tử!", "Xin chào", "Con chào Thám tử", "Chào bạn"]
+SECOND_TURNS = ["Con 8 tuổi", "con 8 tuổi ạ", "Con tên là Bi", "Con tên là Na", "Con 9 tuổi"]
+UNIQUE = ["Hôm nay con vừa đi sở thú với ông bà", "Con đang xếp một lâu đài lego thật to",
+          "Con mới học bơi được 3 buổi", "Con vừa đọc xong truyện Dế Mèn"]
+
+
+def conversation(rng):
+    # 80% bé mở đầu bằng câu quen thuộc, còn lại gõ câu riêng; lượt 3 luôn là câu riêng
+    first = rng.choice(OPENERS) if rng.random() < 0.8 else rng.choice(UNIQUE) + f" {rng.randint(1, 999)}"
+    second = rng.choice(SECOND_TURNS) if rng.random() < 0.6 else rng.choice(UNIQUE)
+    return [first, second, rng.choice(UNIQUE)]
+
+
+async def run(backend, fake, cache, prefix, kids, concurrency, seed):
+    import httpx
+
+    backend.response_cache = cache
+    calls_before = fake.counts["calls"]
+    rng = random.Random(seed)
+    scripts = [conversation(rng) for _ in range(kids)]
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def kid(n):
+            async with slots:
+                for message in scripts[n]:
+                    start = time.perf_counter()
+                    r = await client.post("/chat", json={"session_id": f"{prefix}-{n}", "user_message": message,
+                                                         "child_age": 8})
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(kid(n) for n in range(kids)))
+    return fake.counts["calls"] - calls_before, latencies
+
+
+def make_cache(size, db_path=None):
+    return ResponseCache(max_entries=size, ttl_seconds=3600, db_path=db_path)
+
+
+async def main_async(args):
+    os.environ["RESPONSE_CACHE_SIZE"] = "2048"  # load_backend tắt cache mặc định; bài đo này cần bật
+    backend, fake = load_backend(latency=args.latency)
+    print(f"{'cấu hình':<24}{'gọi LLM':>9}{'hit rate':>10}{'p50(ms)':>9}{'p95(ms)':>9}{'tiết kiệm (s)':>15}")
+
+    def line(name, calls, latencies, cache):
+        stats = cache.stats()
+        print(f"{name:<24}{calls:>9}{stats['hit_rate']:>10.0%}{percentile(latencies, 50) * 1000:>9.0f}"
+              f"{percentile(latencies, 95) * 1000:>9.0f}{stats['latency_saved_s']:>15.1f}")
+
+    off = make_cache(0)
+    calls, latencies = await run(backend, fake, off, "off", args.kids, args.concurrency, args.seed)
+    line("tắt cache", calls, latencies, off)
+
+    on = make_cache(2048)
+    calls, latencies = await run(backend, fake, on, "ram", args.kids, args.concurrency, args.seed)
+    line("RAM", calls, latencies, on)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "response_cache.db")
+        worker1 = make_cache(2048, db_path)
+        await run(backend, fake, worker1, "w1", args.kids, args.concurrency, args.seed)
+        worker2 = make_cache(2048, db_path)  # Như 1 worker khác: RAM trống, dùng chung file SQLite
+        calls, latencies = await run(backend, fake, worker2, "w2", args.kids, args.concurrency, args.seed + 1)
+        line("RAM + SQLite (worker 2)", calls, latencies, worker2)
+        print(f"\nworker 2: {worker2.stats()['db_hits']} hit lấy từ SQLite, "
+              f"{worker2.stats()['skipped']} lượt không đủ điều kiện cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kids", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Độ trễ giả lập của Gemini (giây)")
+    parser.add_argument("--seed", type=int, default=3)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
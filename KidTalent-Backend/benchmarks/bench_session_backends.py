@@ -0,0 +1,58 @@
+"""
+So sánh thông lượng ghi/đọc lịch sử chat giữa kho trong RAM và SQLite (WAL).
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_session_backends --sessions 500 --turns 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from session_store import SQLiteSessionStore, SessionStore
+
+
+def run(store, sessions: int, turns: int):
+    # Ghi: mỗi lượt = 1 cặp (bé, Thám tử) như RunnableWithMessageHistory
+    start = time.perf_counter()
+    for t in range(turns):
+        for s in range(sessions):
+            history = store.get_session_history(f"s{s}")
+            history.add_messages([
+                HumanMessage(content=f"Con thích vẽ con mèo số {t}"),
+                AIMessage(content=f"Ồ hay quá! Con mèo số {t} màu gì vậy nhóc?"),
+            ])
+    write_s = time.perf_counter() - start
+
+    # Đọc: lấy toàn bộ lịch sử của từng phiên như /analyze
+    start = time.perf_counter()
+    total = 0
+    for s in range(sessions):
+        total += len(store.get(f"s{s}").messages)
+    read_s = time.perf_counter() - start
+    assert total == sessions * turns * 2
+    return write_s, read_s
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=500)
+    ap.add_argument("--turns", type=int, default=10)
+    args = ap.parse_args()
+
+    appends = args.sessions * args.turns
+    print(f"{'backend':>8} {'turn appends/s':>15} {'session reads/s':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "memory": SessionStore(max_sessions=args.sessions, max_messages=0),
+            "sqlite": SQLiteSessionStore(os.path.join(tmp, "sessions.db"), max_sessions=args.sessions, max_messages=0),
+        }
+        for name, store in stores.items():
+            write_s, read_s = run(store, args.sessions, args.turns)
+            print(f"{name:>8} {appends / write_s:>15.0f} {args.sessions / read_s:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
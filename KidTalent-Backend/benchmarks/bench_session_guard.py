@@ -0,0 +1,94 @@
+"""
+Đo tác dụng của session_guard với request trùng lặp (LLM giả, không cần mạng).
+
+- Bấm gửi 2 lần: mỗi lượt chat được gửi 2 lần cùng lúc -> số lời gọi Gemini, tin nhắn bị lặp trong lịch sử.
+- Bấm "Phân tích" liên tục: nhiều /analyze cùng lúc cho 1 phiên -> số lần phân tích thật sự.
+- 1 phiên gửi dồn dập: bao nhiêu request bị chặn 429 bởi token bucket.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_session_guard --kids 30 --latency 0.2
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+
+from benchmarks.fake_llm import load_backend
+from benchmarks.load_test import KID_MESSAGES
+from session_guard import SessionGuard
+
+
+class NoGuard(SessionGuard):
+    # Như trước khi có session_guard: không khóa phiên, không gộp request
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        yield
+
+    async def coalesce(self, key, make_coro):
+        return await make_coro()
+
+
+async def run(backend, fake, guard, prefix, args):
+    import httpx
+
+    backend.session_guard = guard
+    calls_before = fake.counts["calls"]
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def chat(n):
+            for t in range(args.turns):
+                payload = {"session_id": f"{prefix}-{n}", "user_message": KID_MESSAGES[(n + t) % len(KID_MESSAGES)],
+                           "child_age": 8}
+                await asyncio.gather(*(client.post("/chat", json=payload) for _ in range(2)))
+
+        await asyncio.gather(*(chat(n) for n in range(args.kids)))
+        chat_calls = fake.counts["calls"] - calls_before
+        await asyncio.gather(*(client.post("/analyze", json={"session_id": f"{prefix}-{n}", "child_age": 8})
+                               for n in range(args.kids) for _ in range(args.clicks)))
+        analyze_calls = fake.counts["calls"] - calls_before - chat_calls
+
+    extra_messages = sum(len(backend.get_session_history(f"{prefix}-{n}").messages) - 2 * args.turns
+                         for n in range(args.kids))
+    return chat_calls, analyze_calls, extra_messages
+
+
+async def burst(backend, args):
+    import httpx
+
+    backend.session_guard = SessionGuard(session_rate_per_minute=30, session_burst=10, global_rate_per_second=0)
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        responses = await asyncio.gather(*(
+            client.post("/chat", json={"session_id": "spam", "user_message": f"Tin số {i}", "child_age": 8})
+            for i in range(args.burst)
+        ))
+    limited = [r for r in responses if r.status_code == 429]
+    retry_after = limited[0].headers.get("retry-after") if limited else "-"
+    print(f"\n1 phiên gửi {args.burst} tin cùng lúc (30/phút, burst 10): {len(limited)} bị 429, "
+          f"Retry-After={retry_after}s")
+
+
+async def main_async(args):
+    backend, fake = load_backend(latency=args.latency)
+    print(f"{args.kids} bé, mỗi lượt chat gửi 2 lần, bấm Phân tích {args.clicks} lần cùng lúc")
+    print(f"{'cấu hình':<18}{'LLM /chat':>11}{'LLM /analyze':>14}{'tin nhắn lặp':>14}")
+    for name, guard, prefix in [("không bảo vệ", NoGuard(0, 0, 0), "off"),
+                                ("session_guard", SessionGuard(0, 0, 0), "on")]:
+        calls, analyze_calls, extra = await run(backend, fake, guard, prefix, args)
+        print(f"{name:<18}{calls:>11}{analyze_calls:>14}{extra:>14}")
+        if prefix == "on":
+            print(f"\nsession_guard: {guard.stats()}")
+    await burst(backend, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kids", type=int, default=30)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--clicks", type=int, default=3, help="Số lần bấm Phân tích cùng lúc")
+    parser.add_argument("--burst", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.2, help="Độ trễ giả lập của Gemini (giây)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+So sánh thời gian tới token đầu tiên (TTFT) của /chat/stream với độ trễ
+toàn bộ câu trả lời của /chat, dùng LLM giả (không cần mạng).
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.bench_streaming --latency 0.3 --token-delay 0.05 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.fake_llm import LiveServer, load_backend
+
+
+async def measure(base_url: str, rounds: int):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        full, ttft, stream_total = [], [], []
+        for i in range(rounds):
+            payload = {"session_id": f"stream-{i}", "user_message": "Con thích vẽ", "child_age": 8}
+
+            start = time.perf_counter()
+            r = await client.post("/chat", json=payload)
+            r.raise_for_status()
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            first = None
+            async with client.stream("POST", "/chat/stream", json=payload) as resp:
+                async for line in resp.aiter_lines():
+                    if first is None and line.startswith("data:") and "token" in json.loads(line[5:]):
+                        first = time.perf_counter() - start
+            ttft.append(first)
+            stream_total.append(time.perf_counter() - start)
+        return full, ttft, stream_total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--token-delay", type=float, default=0.05)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    backend, _ = load_backend(latency=args.latency, token_delay=args.token_delay)
+
+    with LiveServer(backend.app) as server:
+        full, ttft, stream_total = asyncio.run(measure(server.url, args.rounds))
+    print(f"/chat        full reply  median: {statistics.median(full) * 1000:8.1f} ms")
+    print(f"/chat/stream first token median: {statistics.median(ttft) * 1000:8.1f} ms")
+    print(f"/chat/stream full stream median: {statistics.median(stream_total) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.exceptions import ModelAPIError
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr, ValidationError
+
+# Hồ sơ mẫu mà LLM giả trả về cho các prompt phân tích
+CANNED_PROFILE = {
+    "summary": "Bé thích vẽ tranh và kể chuyện về các con vật.",
+    "dominant_intelligence": "Không gian - Hình ảnh",
+    "personality_traits": ["Sáng tạo", "Tò mò", "Tỉ mỉ"],
+    "suggested_careers": ["Họa sĩ minh họa", "Kiến trúc sư", "Nhà thiết kế đồ họa"],
+    "advice_for_parents": "Hãy cho bé tham gia lớp vẽ và cùng bé đọc truyện tranh.",
+}
+
+CANNED_SUMMARY = "Bé 8 tuổi, thích vẽ tranh con vật và kể chuyện; đã hỏi về môn học yêu thích."
+
+CANNED_CHAT_REPLY = "Ồ hay quá! Thám tử Gà Mơ muốn biết thêm: nhóc thích làm gì nhất vào cuối tuần?"
+
+
+# LLM giả lập Gemini: không cần mạng, không cần GOOGLE_API_KEY.
+# Có độ trễ cấu hình được để đo hiệu năng của backend, và có thể "gây lỗi" để thử lớp resilience.
+class FakeGeminiChat(BaseChatModel):
+    latency: float = 0.5       # Độ trễ trước token đầu tiên (giây)
+    token_delay: float = 0.0   # Độ trễ giữa các token khi stream
+    chat_reply: str = CANNED_CHAT_REPLY
+    talent_profile: dict = CANNED_PROFILE
+    # Giả lập sự cố
+    failure_rate: float = 0.0    # Tỉ lệ lời gọi lỗi 503 (lỗi tạm thời)
+    fail_first: int = 0          # N lời gọi đầu tiên đều lỗi (giả lập Gemini sập rồi hồi phục)
+    hang_rate: float = 0.0       # Tỉ lệ lời gọi bị treo thêm hang_seconds
+    hang_seconds: float = 30.0
+    malformed_rate: float = 0.0  # Tỉ lệ câu trả lời phân tích bị cụt (JSON hỏng)
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr(default=None)
+    _counts: dict = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        self._counts = {"calls": 0, "failures": 0, "hangs": 0, "malformed": 0, "repairs": 0}
+
+    @property
+    def counts(self) -> dict:
+        return dict(self._counts)
+
+    def _fault(self) -> float:
+        # Trả về số giây treo thêm; hoặc ném lỗi 503 giả
+        self._counts["calls"] += 1
+        if self._counts["calls"] <= self.fail_first or self._rng.random() < self.failure_rate:
+            self._counts["failures"] += 1
+            raise ModelAPIError("503 UNAVAILABLE: The model is overloaded (giả lập)")
+        if self._rng.random() < self.hang_rate:
+            self._counts["hangs"] += 1
+            return self.hang_seconds
+        return 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _usage(self, messages: List[BaseMessage], reply: str, schema_chars: int = 0) -> dict:
+        # Số token ước lượng (~3 ký tự/token) để /metrics có số liệu khi chạy với LLM giả
+        prompt_tokens = (sum(len(str(m.content)) for m in messages) + schema_chars) // 3 + 1
+        completion_tokens = len(reply) // 3 + 1
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _total_delay(self, text: str) -> float:
+        # Trả lời không stream vẫn phải chờ sinh đủ token
+        return self.latency + self.token_delay * len(self._tokens(text))
+
+    def _reply_for(self, messages: List[BaseMessage]) -> str:
+        prompt_text = messages[-1].content if messages else ""
+        if "ĐOẠN JSON LỖI" in prompt_text:
+            self._counts["repairs"] += 1
+            return json.dumps(self.talent_profile, ensure_ascii=False)
+        if "Chuyên gia Tâm lý" in prompt_text:
+            profile = json.dumps(self.talent_profile, ensure_ascii=False)
+            if self._rng.random() < self.malformed_rate:
+                # Như khi Gemini bị cắt giữa chừng: JSON thiếu phần cuối
+                self._counts["malformed"] += 1
+                return profile[: len(profile) * 2 // 3]
+            return profile
+        if "Tóm tắt mới:" in prompt_text:
+            return CANNED_SUMMARY
+        return self.chat_reply
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        hang = self._fault()
+        reply = self._reply_for(messages)
+        time.sleep(self._total_delay(reply) + hang)
+        message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply, kwargs.get("schema_chars", 0)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        hang = self._fault()
+        reply = self._reply_for(messages)
+        await asyncio.sleep(self._total_delay(reply) + hang)
+        message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply, kwargs.get("schema_chars", 0)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs: Any):
+        # Như Gemini (json_schema): schema gửi kèm request chứ không nằm trong prompt,
+        # nhưng vẫn tính vào token đầu vào
+        bound = self.bind(schema_chars=len(json.dumps(schema.model_json_schema(), ensure_ascii=False)))
+
+        def parse(message):
+            try:
+                parsed, error = schema.model_validate_json(message.text), None
+            except ValidationError as e:
+                parsed, error = None, e
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": error}
+            if error is not None:
+                raise error
+            return parsed
+
+        return bound | RunnableLambda(parse)
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        # Tách theo từ (giữ khoảng trắng) để mô phỏng token stream
+        words = text.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency + self._fault())
+        reply = self._reply_for(messages)
+        for token in self._tokens(reply):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, reply)))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency + self._fault())
+        reply = self._reply_for(messages)
+        for token in self._tokens(reply):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, reply)))
+
+
+class LiveServer:
+    """Chạy app bằng uvicorn trong 1 thread nền (ASGITransport của httpx không stream thật)."""
+
+    def __init__(self, app, port: int = 8765):
+        import uvicorn
+
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = None
+
+    def __enter__(self):
+        import threading
+
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def load_backend(**kwargs):
+    """Import main rồi gắn FakeGeminiChat vào backend. Không cần GOOGLE_API_KEY.
+
+    Trả về (module main, LLM giả).
+    """
+    import os
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # Tắt log từng lượt chat khi đo
+    # Bài đo tự bắn hàng trăm request/giây -> tắt giới hạn tốc độ (trừ khi bài đo tự đặt)
+    os.environ.setdefault("SESSION_RATE_PER_MINUTE", "0")
+    os.environ.setdefault("GLOBAL_RATE_PER_SECOND", "0")
+    # Cache câu trả lời chat làm các vòng đo sau chỉ còn vài ms -> tắt (bench_response_cache tự bật)
+    os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+    import main
+
+    fake = FakeGeminiChat(**kwargs)
+    main.ai.use_llm(fake)
+    return main, fake
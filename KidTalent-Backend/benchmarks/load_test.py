@@ -0,0 +1,173 @@
+"""
+Bộ đo hiệu năng offline cho backend: chạy main.app ngay trong tiến trình với LLM giả
+(độ trễ cấu hình được, trả về Talent_profile mẫu) -> không cần mạng, không cần GOOGLE_API_KEY.
+
+Mỗi "bé" ảo: chat N lượt -> /analyze -> /report. Nhiều bé chạy song song.
+Kết quả: thông lượng, p50/p95/p99 theo endpoint, RSS tăng thêm mỗi phiên, thời gian render PDF.
+
+Chạy (trong thư mục KidTalent-Backend):
+    python -m benchmarks.load_test --sessions 50 --concurrency 10 --turns 4 --latency 0.2
+    python -m benchmarks.load_test --max-p95-ms 1500 --max-rss-kb-per-session 200   # dùng trong CI
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.fake_llm import load_backend
+
+KID_MESSAGES = [
+    "Con chào Thám tử! Con tên là Bi, con 8 tuổi",
+    "Con thích vẽ khủng long và tàu vũ trụ",
+    "Cuối tuần con hay đi đá bóng với bố",
+    "Con thích môn toán nhất vì được giải đố",
+    "Lớn lên con muốn làm phi hành gia",
+    "Con có nuôi một con mèo tên là Mướp",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def run_load(backend, sessions: int, concurrency: int, turns: int, prefix: str = "load"):
+    import httpx
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    rejected = defaultdict(int)  # 503 do hàng đợi PDF đầy (backpressure), không tính là lỗi
+    slots = asyncio.Semaphore(concurrency)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def call(endpoint, payload):
+            start = time.perf_counter()
+            r = await client.post(endpoint, json=payload)
+            latencies[endpoint].append(time.perf_counter() - start)
+            if r.status_code == 503:
+                rejected[endpoint] += 1
+            elif r.status_code != 200 or (r.headers.get("content-type", "").startswith("application/json")
+                                        and "error" in r.json()):
+                errors[endpoint] += 1
+
+        async def kid(n):
+            async with slots:
+                session_id = f"{prefix}-{n}"
+                for t in range(turns):
+                    message = KID_MESSAGES[(n + t) % len(KID_MESSAGES)]
+                    await call("/chat", {"session_id": session_id, "user_message": message, "child_age": 8})
+                await call("/analyze", {"session_id": session_id, "child_age": 8})
+                await call("/report", {"session_id": session_id, "child_age": 8})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(kid(n) for n in range(sessions)))
+        wall = time.perf_counter() - start
+    return wall, latencies, errors, rejected
+
+
+def pdf_render_seconds(backend):
+    # Lấy thời gian render PDF trung bình từ histogram của /metrics
+    total = count = 0.0
+    for metric in backend.REGISTRY.collect():
+        if metric.name != "kidtalent_stage_duration_seconds":
+            continue
+        for sample in metric.samples:
+            if sample.labels.get("stage") != "pdf_render" or sample.labels.get("pipeline") != "report":
+                continue
+            if sample.name.endswith("_sum"):
+                total += sample.value
+            elif sample.name.endswith("_count"):
+                count += sample.value
+    return total / count if count else 0.0
+
+
+async def main_async(args):
+    backend, _ = load_backend(latency=args.latency, token_delay=args.token_delay)
+    from session_store import _process_rss_bytes
+
+    # Chạy lifespan như khi khởi động thật (làm nóng font PDF, tắt pool khi xong)
+    async with backend.app.router.lifespan_context(backend.app):
+        while backend.startup_state["warm_up_ms"] is None:  # Đợi warm-up nền xong (như /ready)
+            await asyncio.sleep(0.05)
+        await run_load(backend, min(args.concurrency, args.sessions), args.concurrency, 1, prefix="warmup")
+        rss_before = _process_rss_bytes() or 0
+        wall, latencies, errors, rejected = await run_load(backend, args.sessions, args.concurrency, args.turns)
+        rss_after = _process_rss_bytes() or 0
+
+    total_requests = sum(len(v) for v in latencies.values())
+    result = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "llm_latency_s": args.latency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total_requests / wall, 2),
+        "rss_growth_kb_per_session": round((rss_after - rss_before) / 1024 / args.sessions, 2),
+        "pdf_render_ms": round(pdf_render_seconds(backend) * 1000, 2),
+        "endpoints": {
+            endpoint: {
+                "requests": len(values),
+                "errors": errors[endpoint],
+                "rejected_503": rejected[endpoint],
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+            for endpoint, values in latencies.items()
+        },
+    }
+    return result
+
+
+def print_report(result):
+    print(f"sessions={result['sessions']} concurrency={result['concurrency']} "
+          f"llm_latency={result['llm_latency_s']}s wall={result['wall_s']}s "
+          f"throughput={result['throughput_rps']} req/s")
+    print(f"{'endpoint':>10} {'requests':>9} {'errors':>7} {'503':>5} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for endpoint, row in result["endpoints"].items():
+        print(f"{endpoint:>10} {row['requests']:>9} {row['errors']:>7} {row['rejected_503']:>5} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+    print(f"RSS growth per session: {result['rss_growth_kb_per_session']} KB")
+    print(f"PDF render (avg)      : {result['pdf_render_ms']} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--turns", type=int, default=4, help="Số lượt chat mỗi bé trước khi phân tích")
+    ap.add_argument("--latency", type=float, default=0.2, help="Độ trễ của LLM giả (giây)")
+    ap.add_argument("--token-delay", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    ap.add_argument("--max-p95-ms", type=float, default=None, help="Báo lỗi nếu p95 của endpoint nào vượt ngưỡng")
+    ap.add_argument("--max-rss-kb-per-session", type=float, default=None)
+    args = ap.parse_args()
+
+    result = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+    # Ngưỡng hồi quy hiệu năng: exit code 1 để chặn deploy
+    failures = []
+    if args.max_p95_ms is not None:
+        for endpoint, row in result["endpoints"].items():
+            if row["p95_ms"] > args.max_p95_ms:
+                failures.append(f"{endpoint} p95 {row['p95_ms']} ms > {args.max_p95_ms} ms")
+    if args.max_rss_kb_per_session is not None and result["rss_growth_kb_per_session"] > args.max_rss_kb_per_session:
+        failures.append(f"RSS growth {result['rss_growth_kb_per_session']} KB/session > {args.max_rss_kb_per_session}")
+    if any(row["errors"] for row in result["endpoints"].values()):
+        failures.append("có request bị lỗi")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
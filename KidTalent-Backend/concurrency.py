@@ -0,0 +1,65 @@
+import asyncio
+
+
+# Giới hạn số lời gọi LLM đang chạy cùng lúc.
+# Các request vượt giới hạn sẽ xếp hàng (await) thay vì chặn cả event loop.
+class LLMLimiter:
+    def __init__(self, max_concurrency: int):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency phải >= 1")
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Chỉ 1 batch được gom slot tại 1 thời điểm (2 batch cùng gom dở dang sẽ chờ nhau mãi)
+        self._batch_lock = asyncio.Lock()
+        self.in_flight = 0  # Số lời gọi đang chạy
+        self.waiting = 0    # Số lời gọi đang chờ tới lượt
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+    async def batch(self, runnable, inputs, max_concurrency: int, config: dict = None):
+        """Chạy runnable.abatch với tối đa max_concurrency lời gọi song song, tính vào giới hạn chung.
+
+        Kết quả lỗi được trả về dưới dạng Exception tại đúng vị trí (return_exceptions=True).
+        """
+        slots = max(1, min(len(inputs), max_concurrency, self.max_concurrency))
+        acquired = 0
+        self.waiting += slots
+        try:
+            async with self._batch_lock:
+                for _ in range(slots):
+                    await self._semaphore.acquire()
+                    acquired += 1
+        except BaseException:
+            for _ in range(acquired):
+                self._semaphore.release()
+            raise
+        finally:
+            self.waiting -= slots
+
+        self.in_flight += slots
+        try:
+            return await runnable.abatch(inputs, config={**(config or {}), "max_concurrency": slots},
+                                         return_exceptions=True)
+        finally:
+            self.in_flight -= slots
+            for _ in range(slots):
+                self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+        }
@@ -0,0 +1,93 @@
+"""
+Xuất hội thoại + hồ sơ tài năng (Talent_profile) ra NDJSON (mỗi dòng 1 phiên, tùy chọn nén gzip)
+cho nhóm phân tích dữ liệu. Đọc từng trang bằng generator nên bộ nhớ không tăng theo số phiên.
+
+Xuất tăng dần: mỗi lần xuất trả về 1 con trỏ (cursor); lần sau truyền lại con trỏ đó
+để chỉ lấy các phiên đã thay đổi kể từ lần trước.
+
+Chạy trực tiếp trên file SQLite (SESSION_BACKEND=sqlite), trong thư mục KidTalent-Backend:
+    python -m export --db data/sessions.db --out export.ndjson.gz --gzip --cursor-file data/export.cursor
+"""
+import argparse
+import json
+import os
+import sys
+import zlib
+
+CHUNK_BYTES = 64 * 1024  # Gom output thành từng khối ~64 KB trước khi gửi/ghi
+
+
+def export_records(store, since: int = 0, until: int = None, include_messages: bool = True):
+    """Các phiên đã thay đổi sau con trỏ `since` (tới `until`, mặc định: con trỏ hiện tại)."""
+    if until is None:
+        until = store.export_cursor()
+    return store.iter_changed(since, until, include_messages=include_messages)
+
+
+def iter_ndjson(records, compress: bool = False, chunk_bytes: int = CHUNK_BYTES):
+    # Mã hóa từng bản ghi thành 1 dòng JSON; nén gzip theo luồng (không giữ cả file trong RAM)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: định dạng gzip
+    buffer = []
+    size = 0
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def read_cursor(path: str) -> int:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def main():
+    from session_store import SQLiteSessionStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("SESSION_DB_PATH", os.path.join("data", "sessions.db")))
+    parser.add_argument("--out", default="-", help="File kết quả ('-' = stdout)")
+    parser.add_argument("--gzip", action="store_true", help="Nén gzip")
+    parser.add_argument("--since", type=int, default=None, help="Chỉ xuất phiên thay đổi sau con trỏ này")
+    parser.add_argument("--cursor-file", default=None,
+                        help="Đọc con trỏ lần trước từ file này, xuất xong thì ghi con trỏ mới vào")
+    parser.add_argument("--no-messages", action="store_true", help="Chỉ xuất hồ sơ, không kèm tin nhắn")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"Không tìm thấy file SQLite: {args.db}")
+    since = args.since if args.since is not None else (read_cursor(args.cursor_file) if args.cursor_file else 0)
+
+    store = SQLiteSessionStore(args.db)
+    until = store.export_cursor()
+    chunks = iter_ndjson(export_records(store, since, until, include_messages=not args.no_messages), args.gzip)
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    # Chỉ ghi con trỏ mới khi đã xuất xong (lỗi giữa chừng -> lần sau xuất lại từ con trỏ cũ)
+    if args.cursor_file:
+        with open(args.cursor_file, "w", encoding="utf-8") as f:
+            f.write(str(until))
+    print(f"Đã xuất các phiên thay đổi trong ({since}, {until}]", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
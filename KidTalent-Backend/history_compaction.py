@@ -0,0 +1,124 @@
+import bisect
+import logging
+from collections import OrderedDict
+
+from transcript import render_message
+
+logger = logging.getLogger("kidtalent")
+
+
+def estimate_tokens(text: str) -> int:
+    # Ước lượng nhanh, không gọi API: tiếng Việt trung bình ~3 ký tự/token
+    return len(text) // 3 + 1
+
+
+class _SummaryState:
+    __slots__ = ("summary", "last_folded_id", "message_count")
+
+    def __init__(self):
+        self.summary = ""
+        self.last_folded_id = None  # Mã vị trí (message_ids của history) của tin nhắn cuối cùng đã gộp
+        self.message_count = 0
+
+
+# Nén lịch sử chat trước khi đưa vào prompt:
+# - Giữ nguyên văn keep_turns lượt gần nhất
+# - Các lượt cũ hơn được gộp dần vào 1 bản tóm tắt (mỗi lần chỉ gộp phần mới,
+#   không tóm tắt lại từ đầu), gộp theo lô batch_turns lượt để ít gọi LLM
+# - Tổng prompt không vượt token_budget
+class HistoryCompactor:
+    def __init__(self, summarize, keep_turns: int = 6, batch_turns: int = 4, token_budget: int = 2000,
+                 max_sessions: int = 10000):
+        # summarize: async (tóm tắt cũ, các lượt mới dạng text) -> tóm tắt mới
+        self.summarize = summarize
+        self.keep_messages = keep_turns * 2
+        self.batch_messages = batch_turns * 2
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()  # session_id -> _SummaryState
+        self.summaries = 0
+        self.summary_failures = 0
+        self.turns = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+
+    def _state(self, session_id: str) -> _SummaryState:
+        state = self._states.get(session_id)
+        if state is None:
+            state = self._states[session_id] = _SummaryState()
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+        self._states.move_to_end(session_id)
+        return state
+
+    async def compact(self, session_id: str, messages, ids, reserved_tokens: int = 0) -> str:
+        # ids: mã vị trí tăng dần của từng tin nhắn (message_ids của history), không bao giờ dùng lại
+        state = self._state(session_id)
+        state.message_count = len(messages)
+        older = messages[:-self.keep_messages] if len(messages) > self.keep_messages else []
+        recent = messages[len(older):]
+
+        pending = older[self._folded_prefix(state, ids):]
+
+        if len(pending) >= self.batch_messages:
+            new_turns = "\n".join(render_message(m) for m in pending)
+            try:
+                state.summary = (await self.summarize(state.summary, new_turns)).strip()
+                state.last_folded_id = ids[len(older) - 1]
+                self.summaries += 1
+                pending = []
+            except Exception as e:
+                # Tóm tắt lỗi thì giữ nguyên văn, thử lại ở lượt sau; không làm hỏng lượt chat
+                self.summary_failures += 1
+                logger.warning("Tóm tắt lịch sử phiên %s thất bại: %s", session_id, e)
+
+        lines = [render_message(m) for m in list(pending) + list(recent)]
+        return self._fit_budget(state.summary, lines, self.token_budget - reserved_tokens)
+
+    @staticmethod
+    def _folded_prefix(state: _SummaryState, ids) -> int:
+        # Số tin nhắn đầu danh sách đã được gộp vào tóm tắt. Lịch sử chỉ bị cắt ở đầu nên đó là các tin
+        # có mã <= tin gộp cuối cùng (không so nội dung: "có", "dạ"... lặp lại sẽ khớp nhầm).
+        # Phiên bị xóa/tạo lại thì mã mới đều lớn hơn -> không tin nào được coi là đã gộp.
+        if state.last_folded_id is None or not ids:
+            return 0
+        return bisect.bisect_right(ids, state.last_folded_id)
+
+    @staticmethod
+    def _fit_budget(summary: str, lines, budget: int) -> str:
+        summary_block = f"(Tóm tắt các lượt trước: {summary})" if summary else ""
+        used = estimate_tokens(summary_block) + sum(estimate_tokens(line) for line in lines)
+
+        # Vượt ngân sách: bỏ bớt các dòng cũ nhất, luôn giữ ít nhất lượt cuối
+        start = 0
+        while used > budget and len(lines) - start > 2:
+            used -= estimate_tokens(lines[start])
+            start += 1
+        lines = lines[start:]
+
+        # Vẫn vượt: cắt ngắn phần tóm tắt
+        if used > budget and summary_block:
+            room = max(0, budget - (used - estimate_tokens(summary_block))) * 3
+            summary_block = summary_block[:room]
+
+        return "\n".join(([summary_block] if summary_block else []) + lines)
+
+    def record_prompt(self, session_id: str, prompt_tokens: int):
+        # Ghi log số token prompt mỗi lượt để kiểm tra chi phí không tăng theo độ dài hội thoại
+        self.turns += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.prompt_tokens_max = max(self.prompt_tokens_max, prompt_tokens)
+        state = self._states.get(session_id)
+        history_messages = state.message_count if state else 0
+        logger.info("chat prompt session=%s history_messages=%d prompt_tokens=%d",
+                    session_id, history_messages, prompt_tokens)
+
+    def stats(self):
+        return {
+            "sessions": len(self._states),
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "turns": self.turns,
+            "avg_prompt_tokens": round(self.prompt_tokens_total / self.turns, 1) if self.turns else 0.0,
+            "max_prompt_tokens": self.prompt_tokens_max,
+        }
@@ -1,41 +1,179 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Mốc đo thời gian import (cold start)
 import os
+import io
+import re
+import json
+import hashlib
+import hmac
+import asyncio
+import logging
+import threading
+import zipfile
+from typing import List, Literal, Optional
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import PydanticOutputParser
-from schemas import Talent_profile
-from fastapi.responses import StreamingResponse
-import io
-from report_generator import create_talent_pdf
+from langchain_core.messages import AIMessage, HumanMessage
+from schemas import Talent_profile, compact_format_instructions
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pdf_pool import PdfRenderPool, PoolSaturated
+from concurrency import LLMLimiter
+from resilience import CircuitBreaker, LLMUnavailable, OutputRepairer, ResilientCaller
+from response_cache import ResponseCache
+from report_jobs import JobQueueFull, ReportJobQueue, ReportStore, public_job
+from session_guard import RateLimited, SessionGuard
+from export import export_records, iter_ndjson
+from analysis_cache import AnalysisCache
+from session_store import create_session_store
+from history_compaction import HistoryCompactor, estimate_tokens
+from transcript import TranscriptCache
+from metrics import REGISTRY, MetricsCallbackHandler, StatsCollector, HTTP_REQUEST_SECONDS, observe_stage, register_collector, render_metrics
 import uuid
 # 1. Cấu hình & Bảo mật
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("kidtalent")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # Chỉ kiểm tra khi tạo LLM, không chặn lúc import
 
-if not GOOGLE_API_KEY:
-    raise ValueError("LỖI: Chưa tìm thấy API Key!")
+# Số lời gọi Gemini tối đa được chạy song song trên mỗi worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Cache kết quả phân tích: số hồ sơ tối đa và thời gian sống (giây)
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "1800"))
+# Giới hạn kho phiên chat: số phiên tối đa, thời gian rảnh trước khi xóa (giây), số tin nhắn/phiên
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+# Pool tạo PDF: số worker, số báo cáo tối đa được chờ/chạy cùng lúc, loại pool (process|thread)
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_POOL_MAX_PENDING = int(os.getenv("PDF_POOL_MAX_PENDING", str(PDF_POOL_WORKERS * 4)))
+PDF_POOL_KIND = os.getenv("PDF_POOL_KIND", "process")
+# Nén lịch sử chat: số lượt giữ nguyên văn, số lượt gộp vào tóm tắt mỗi lần, ngân sách token của prompt
+CHAT_KEEP_TURNS = int(os.getenv("CHAT_KEEP_TURNS", "6"))
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", "4"))
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "2000"))
+# Điều kiện tối thiểu để phân tích (kiểm tra trước khi tốn 1 lời gọi LLM)
+MIN_ANALYSIS_MESSAGES = int(os.getenv("MIN_ANALYSIS_MESSAGES", "2"))
+MIN_ANALYSIS_CHARS = int(os.getenv("MIN_ANALYSIS_CHARS", "20"))
+# Phân tích cả lớp: số bé tối đa mỗi lần, số lời gọi LLM song song của 1 batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# Nơi lưu lịch sử chat: "memory" (1 worker) hoặc "sqlite" (chạy được --workers N, giữ dữ liệu khi restart)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sessions.db"))
+# Gọi Gemini "bền": deadline mỗi lần gọi (giây), số lần thử tối đa với lỗi tạm thời, backoff (giây)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "60"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# Cầu dao: số lỗi liên tiếp trước khi ngừng gọi Gemini, thời gian ngừng (giây)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Cách yêu cầu định dạng kết quả phân tích: "verbose" (mặc định, như trước), "compact" hoặc "structured"
+# (xem ANALYSIS_PROMPTS). Chỉ đổi mặc định khi đã có số liệu `bench_analysis_modes --live` với Gemini thật.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "verbose")
+# Cache câu trả lời cho các câu mở đầu hay gặp: số mục (0 = tắt), thời gian sống (giây),
+# chỉ áp dụng cho N lượt đầu và tin nhắn ngắn; đặt RESPONSE_CACHE_DB_PATH để dùng chung qua SQLite
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_MAX_TURN = int(os.getenv("RESPONSE_CACHE_MAX_TURN", "2"))
+RESPONSE_CACHE_MAX_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_CHARS", "40"))
+RESPONSE_CACHE_AGE_BUCKET = int(os.getenv("RESPONSE_CACHE_AGE_BUCKET", "2"))
+RESPONSE_CACHE_DB_PATH = os.getenv("RESPONSE_CACHE_DB_PATH") or None
+RESPONSE_CACHE_DB_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_DB_MAX_ENTRIES", "50000"))
+# Job tạo báo cáo chạy nền: số worker, số job chờ tối đa; thư mục lưu PDF, dung lượng tối đa (byte), thời gian giữ (giây)
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "4"))
+REPORT_JOB_MAX_QUEUED = int(os.getenv("REPORT_JOB_MAX_QUEUED", "100"))
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reports"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "86400"))
+# Giới hạn tốc độ gửi request (0 = tắt): theo từng phiên và cho cả server
+SESSION_RATE_PER_MINUTE = float(os.getenv("SESSION_RATE_PER_MINUTE", "30"))
+SESSION_RATE_BURST = int(os.getenv("SESSION_RATE_BURST", "10"))
+GLOBAL_RATE_PER_SECOND = float(os.getenv("GLOBAL_RATE_PER_SECOND", "50"))
+GLOBAL_RATE_BURST = int(os.getenv("GLOBAL_RATE_BURST", "100"))
+# /export trả toàn bộ hội thoại của trẻ -> chỉ bật khi đặt token (gửi kèm header Authorization: Bearer <token>)
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN") or None
 
 # 2. Khởi tạo kho lưu trữ lịch sử tin nhắn
-# Cấu trúc: { "session_id_1": ChatMessageHistory_1, "session_id_2": ChatMessageHistory_2 }
-user_sessions = {}
+# Kho có giới hạn (số phiên, thời gian rảnh, số tin nhắn) để bộ nhớ không tăng mãi
+session_store = create_session_store(
+    SESSION_BACKEND,
+    db_path=SESSION_DB_PATH,
+    max_sessions=SESSION_MAX_COUNT,
+    idle_ttl_seconds=SESSION_IDLE_TTL,
+    max_messages=SESSION_MAX_MESSAGES
+)
 
 def get_session_history(session_id: str):
-    if session_id not in user_sessions:
-        user_sessions[session_id] = ChatMessageHistory()
-    return user_sessions[session_id]
-
-# 3. Khởi tạo AI Model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=GOOGLE_API_KEY,
-    temperature=0.7
+    return session_store.get_session_history(session_id)
+
+
+async def store_call(fn, *args):
+    # Kho SQLite: chạy trong thread (worker khác đang ghi thì chờ khóa ở đó, không chặn event loop).
+    # Kho RAM: gọi thẳng (dict không an toàn khi nhiều thread cùng sửa).
+    if session_store.blocking_io:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+# Mỗi phiên chỉ 1 lượt chat chạy tại 1 thời điểm, request trùng thì dùng chung kết quả, gửi quá nhanh thì 429
+session_guard = SessionGuard(
+    session_rate_per_minute=SESSION_RATE_PER_MINUTE,
+    session_burst=SESSION_RATE_BURST,
+    global_rate_per_second=GLOBAL_RATE_PER_SECOND,
+    global_burst=GLOBAL_RATE_BURST,
+    max_sessions=SESSION_MAX_COUNT,
 )
 
+
+def check_rate(session_id: str):
+    try:
+        session_guard.check_rate(session_id)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# 3. Khởi tạo AI Model (chỉ gọi khi cần: import langchain_google_genai khá nặng)
+def create_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    if not GOOGLE_API_KEY:
+        raise ValueError("LỖI: Chưa tìm thấy API Key!")
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=GOOGLE_API_KEY,
+        temperature=0.7,
+        max_retries=1,  # Thử lại do llm_caller đảm nhận (tránh thử lại 2 tầng)
+    )
+
+# Mọi lời gọi LLM đều đi qua bộ giới hạn này (dùng ainvoke, không chặn event loop)
+llm_limiter = LLMLimiter(LLM_MAX_CONCURRENCY)
+# ... và qua lớp deadline + thử lại + cầu dao (dùng chung 1 cầu dao cho cả worker)
+llm_caller = ResilientCaller(
+    CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS),
+    timeout=LLM_TIMEOUT_SECONDS,
+    max_attempts=LLM_MAX_ATTEMPTS,
+    base_delay=LLM_RETRY_BASE_DELAY,
+    max_delay=LLM_RETRY_MAX_DELAY,
+)
+
+# Đo thời gian từng bước (prompt, LLM, parser) + đếm token cho /metrics
+metrics_handler = MetricsCallbackHandler()
+
+
+def run_config(pipeline: str, session_id: str = None) -> dict:
+    # Config chung khi gọi chain: gắn callback đo đạc + nhãn pipeline
+    config = {"callbacks": [metrics_handler], "metadata": {"pipeline": pipeline}}
+    if session_id is not None:
+        config["configurable"] = {"session_id": session_id}
+    return config
+
 # 4. Kịch bản thông minh (Prompt có Trí nhớ)
 template = """
 Bạn là "Thám tử Gà Mơ", bạn của các bạn nhỏ.
@@ -56,25 +194,253 @@ prompt = PromptTemplate(
     template=template
 )
 
-# 5. Tạo Chain bằng LCEL
-# Kết nối: Prompt -> LLM -> Output Parser
-base_chain = prompt | llm | StrOutputParser()
-
-# Gắn khả năng quản lý lịch sử cho Chain
-chain_with_history = RunnableWithMessageHistory(
-    base_chain,
-    get_session_history,
-    input_messages_key="user_message",
-    history_messages_key="chat_history",
+# Nhiều bé mở đầu giống hệt nhau ("Chào", "Con 8 tuổi") -> trả lời từ cache, không gọi Gemini.
+# Namespace theo nội dung prompt: sửa prompt thì các câu trả lời cũ (kể cả trong SQLite) không còn dùng.
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_SIZE,
+    ttl_seconds=RESPONSE_CACHE_TTL,
+    max_turn=RESPONSE_CACHE_MAX_TURN,
+    max_message_chars=RESPONSE_CACHE_MAX_CHARS,
+    age_bucket_years=RESPONSE_CACHE_AGE_BUCKET,
+    namespace=hashlib.sha1(template.encode("utf-8")).hexdigest()[:12],
+    db_path=RESPONSE_CACHE_DB_PATH,
+    db_max_entries=RESPONSE_CACHE_DB_MAX_ENTRIES,
+)
+
+# 4b. Nén lịch sử: các lượt cũ được gộp dần vào 1 bản tóm tắt ngắn
+summary_template = """
+Dưới đây là bản tóm tắt cuộc trò chuyện giữa "Thám tử Gà Mơ" và một em bé, cùng các lượt trò chuyện mới.
+Hãy viết lại bản tóm tắt (tối đa 80 từ), giữ lại tên, tuổi, sở thích, điểm mạnh và những câu hỏi đã hỏi.
+
+Tóm tắt hiện tại:
+{summary}
+
+Các lượt mới:
+{new_turns}
+
+Tóm tắt mới:
+"""
+
+summary_prompt = PromptTemplate.from_template(summary_template)
+
+
+async def summarize_turns(summary: str, new_turns: str) -> str:
+    # Chạy bên trong lượt chat đang giữ slot của llm_limiter -> không xin thêm slot (tránh deadlock)
+    return await ai.summary_chain.ainvoke({"summary": summary or "(chưa có)", "new_turns": new_turns})
+
+
+history_compactor = HistoryCompactor(
+    summarize_turns,
+    keep_turns=CHAT_KEEP_TURNS,
+    batch_turns=CHAT_SUMMARY_BATCH_TURNS,
+    token_budget=CHAT_PROMPT_TOKEN_BUDGET,
+    max_sessions=SESSION_MAX_COUNT
 )
+TEMPLATE_TOKENS = estimate_tokens(template)
+
+
+async def compact_history(inputs: dict, config) -> str:
+    session_id = config["configurable"]["session_id"]
+    # RunnableWithMessageHistory vừa đọc chat_history từ chính history này -> message_ids khớp từng tin
+    ids = config["configurable"]["message_history"].message_ids
+    reserved = TEMPLATE_TOKENS + estimate_tokens(inputs["user_message"])
+    return await history_compactor.compact(session_id, inputs["chat_history"], ids, reserved_tokens=reserved)
+
+
+def log_prompt_tokens(prompt_value, config):
+    history_compactor.record_prompt(config["configurable"]["session_id"], estimate_tokens(prompt_value.to_string()))
+    return prompt_value
+
+
+# 5. Tạo Chain bằng LCEL
+# LLM và các chain chỉ được tạo lần đầu khi cần (hoặc khi warm-up chạy nền lúc khởi động)
+class LazyAI:
+    def __init__(self, llm_factory, analysis_mode: str):
+        self._llm_factory = llm_factory
+        self._lock = threading.Lock()
+        self._llm = None
+        self.analysis_mode = analysis_mode
+        self._reset_chains()
+
+    def _reset_chains(self):
+        self._chat_chain = None
+        self._summary_chain = None
+        self._analysis_chain = None
+        self._analysis_fix_chain = None
+
+    def use_llm(self, llm):
+        # Thay LLM (ví dụ LLM giả khi đo hiệu năng); các chain sẽ được tạo lại
+        with self._lock:
+            self._llm = llm
+            self._reset_chains()
+
+    def use_analysis_mode(self, mode: str):
+        if mode not in ANALYSIS_PROMPTS:
+            raise ValueError(f"ANALYSIS_MODE không hợp lệ: {mode!r} (chọn {', '.join(ANALYSIS_PROMPTS)})")
+        with self._lock:
+            self.analysis_mode = mode
+            self._analysis_chain = None
+            self._analysis_fix_chain = None
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = self._llm_factory()
+        return self._llm
+
+    @property
+    def chat_chain(self):
+        if self._chat_chain is None:
+            from langchain_core.runnables.history import RunnableWithMessageHistory
+
+            # Kết nối: Nén lịch sử -> Prompt -> (đếm token) -> LLM -> Output Parser
+            base_chain = (
+                RunnablePassthrough.assign(chat_history=RunnableLambda(compact_history))
+                | prompt
+                | RunnableLambda(log_prompt_tokens)
+                | self.llm
+                | StrOutputParser()
+            )
+
+            # Gắn khả năng quản lý lịch sử cho Chain
+            self._chat_chain = RunnableWithMessageHistory(
+                base_chain,
+                get_session_history,
+                input_messages_key="user_message",
+                history_messages_key="chat_history",
+            )
+        return self._chat_chain
+
+    @property
+    def summary_chain(self):
+        if self._summary_chain is None:
+            self._summary_chain = (summary_prompt | self.llm | StrOutputParser()).with_config(
+                metadata={"pipeline": "chat_summary"}
+            )
+        return self._summary_chain
+
+    @property
+    def analysis_chain(self):
+        # Dựng 1 lần, dùng chung cho /analyze, /report và /analyze/batch
+        if self._analysis_chain is None:
+            analysis_prompt, _ = ANALYSIS_PROMPTS[self.analysis_mode]
+            if self.analysis_mode == "structured":
+                # Gemini ràng buộc đầu ra theo schema; include_raw để còn sửa được khi lệch schema
+                self._analysis_chain = analysis_prompt | self.llm.with_structured_output(Talent_profile, include_raw=True)
+            else:
+                self._analysis_chain = analysis_prompt | self.llm | StrOutputParser()
+        return self._analysis_chain
+
+    @property
+    def analysis_fix_chain(self):
+        if self._analysis_fix_chain is None:
+            _, fix_prompt = ANALYSIS_PROMPTS[self.analysis_mode]
+            self._analysis_fix_chain = fix_prompt | self.llm | StrOutputParser()
+        return self._analysis_fix_chain
+
+    def warm_up(self):
+        # Tạo sẵn mọi thứ (chạy trong thread nền lúc khởi động)
+        return self.chat_chain, self.summary_chain, self.analysis_chain, self.analysis_fix_chain
+
+
+ai = LazyAI(create_llm, ANALYSIS_MODE)
+
+# Tạo PDF chạy ngoài event loop, có giới hạn hàng đợi
+pdf_pool = PdfRenderPool(max_workers=PDF_POOL_WORKERS, max_pending=PDF_POOL_MAX_PENDING, kind=PDF_POOL_KIND)
 
 # 6. API Backend
-app = FastAPI(title="KidTalent AI - Có Trí Nhớ")
+router = APIRouter()
+
+# Trạng thái khởi động: thời gian import, warm-up, request đầu tiên (xem /ready)
+startup_state = {
+    "ready": False,
+    "error": None,
+    "import_ms": None,
+    "warm_up_ms": None,
+    "first_request_ms": None,
+}
+# Các endpoint kiểm tra sức khỏe không tính là "request đầu tiên"
+_PROBE_PATHS = {"/", "/ready", "/stats", "/metrics"}
+
 
-@app.get("/")
+async def warm_up():
+    # Chạy nền sau khi server đã nhận kết nối: font/styles PDF, worker pool, LLM + chain
+    from report_generator import warm_up_report_engine
+
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up_report_engine)
+        await pdf_pool.warm_up()
+        await asyncio.to_thread(ai.warm_up)
+        startup_state["ready"] = True
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error("Warm-up thất bại: %s", e)
+    finally:
+        startup_state["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("Warm-up xong sau %s ms (import %s ms)", startup_state["warm_up_ms"], startup_state["import_ms"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_task = asyncio.create_task(warm_up())
+    report_jobs.start()
+    yield
+    warm_task.cancel()
+    await report_jobs.stop()
+    pdf_pool.shutdown()
+
+
+async def measure_http_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        # Dùng mẫu route (/reports/{id}) thay vì URL thật để số nhãn không tăng vô hạn
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(request.method, getattr(route, "path", "unmatched"), str(status)).observe(elapsed)
+        if startup_state["first_request_ms"] is None and request.url.path not in _PROBE_PATHS:
+            startup_state["first_request_ms"] = round(elapsed * 1000, 1)
+            logger.info("Request đầu tiên (%s) mất %s ms", request.url.path, startup_state["first_request_ms"])
+
+
+@router.get("/")
 def read_root():
     return {"message": "KidTalent Backend is running!", "status": "ok"}
 
+
+@router.get("/ready")
+def read_ready():
+    # Readiness: 200 khi đã warm-up xong, 503 khi còn đang khởi động hoặc warm-up lỗi
+    status_code = 200 if startup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content=startup_state)
+
+
+@router.get("/stats")
+def read_stats():
+    # Số liệu vận hành: hàng đợi LLM, hit/miss của cache phân tích
+    return {
+        "llm": llm_limiter.stats(),
+        "llm_resilience": llm_caller.stats(),
+        "llm_breaker": llm_caller.breaker.stats(),
+        "analysis_parse": {"mode": ai.analysis_mode, **output_repairer.stats()},
+        "pdf_pool": pdf_pool.stats(),
+        "sessions": session_store.stats(),
+        "session_guard": session_guard.stats(),
+        "chat_prompt": history_compactor.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "report_jobs": report_jobs.stats(),
+        "transcripts": transcripts.stats(),
+        "startup": startup_state,
+    }
+
 # Cập nhật Data Model: Thêm session_id
 class ChatRequest(BaseModel):
     session_id: str  # Ví dụ: "be_bi_01"
@@ -84,6 +450,16 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     ai_reply: str
+    cached: bool = False  # True nếu câu trả lời lấy từ response_cache
+
+@router.get("/metrics")
+def read_metrics():
+    # Định dạng Prometheus: histogram từng bước, token, cộng với các số liệu ở /stats
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+register_collector(StatsCollector(read_stats))
 
 # --- [NEW] API PHÂN TÍCH TÀI NĂNG ---
 # 1. Tạo Parser (Bộ dịch mã để ép AI trả về JSON chuẩn)
@@ -101,11 +477,52 @@ YÊU CẦU ĐẦU RA:
 {format_instructions}
 """
 
-analysis_prompt = PromptTemplate(
-    template=analysis_template,
-    input_variables=["age", "chat_history"],
-    partial_variables= {"format_instructions": parser.get_format_instructions()}
-)
+# Prompt sửa JSON hỏng: chỉ gửi lại câu trả lời lỗi (không gửi lịch sử chat) -> rẻ hơn nhiều so với phân tích lại
+analysis_fix_template = """
+Đoạn JSON dưới đây không đúng định dạng yêu cầu.
+
+YÊU CẦU ĐỊNH DẠNG:
+{format_instructions}
+
+ĐOẠN JSON LỖI:
+{completion}
+
+LỖI:
+{error}
+
+Hãy sửa lại và CHỈ trả về JSON hợp lệ, giữ nguyên nội dung phân tích.
+"""
+
+# Phần "YÊU CẦU ĐẦU RA" theo từng chế độ (ANALYSIS_MODE):
+#   verbose   : JSON schema đầy đủ của PydanticOutputParser (dài, gửi lại nguyên văn mỗi lần phân tích)
+#   compact   : danh sách trường rút gọn, vẫn kiểm tra bằng PydanticOutputParser
+#   structured: Gemini tự ràng buộc theo schema (with_structured_output) -> prompt không cần mô tả định dạng
+ANALYSIS_FORMAT_INSTRUCTIONS = {
+    "verbose": parser.get_format_instructions(),
+    "compact": compact_format_instructions(Talent_profile),
+    "structured": "Điền đầy đủ các mục của hồ sơ tài năng, viết bằng tiếng Việt.",
+}
+
+# Prompt được dựng sẵn 1 lần cho mỗi chế độ: (prompt phân tích, prompt sửa JSON)
+ANALYSIS_PROMPTS = {
+    mode: (
+        PromptTemplate(
+            template=analysis_template,
+            input_variables=["age", "chat_history"],
+            partial_variables={"format_instructions": instructions}
+        ),
+        PromptTemplate(
+            template=analysis_fix_template,
+            input_variables=["completion", "error"],
+            # Sửa JSON cần mô tả định dạng ngay trong prompt (kể cả ở chế độ structured)
+            partial_variables={"format_instructions": instructions if mode != "structured"
+                               else ANALYSIS_FORMAT_INSTRUCTIONS["compact"]}
+        ),
+    )
+    for mode, instructions in ANALYSIS_FORMAT_INSTRUCTIONS.items()
+}
+ai.use_analysis_mode(ANALYSIS_MODE)
+output_repairer = OutputRepairer(parser)
 
 
 # 3. Định nghĩa API Endpoint mới
@@ -114,86 +531,233 @@ class AnalyzeRequest(BaseModel):
     child_age: int = 10
 
 
+# /analyze và /report thường được gọi liên tiếp với cùng dữ liệu
+# -> giữ lại hồ sơ đã phân tích để không phải gọi Gemini 2 lần
+analysis_cache = AnalysisCache(max_entries=ANALYSIS_CACHE_SIZE, ttl_seconds=ANALYSIS_CACHE_TTL)
+
+
+# Transcript dạng text của từng phiên, dựng dần theo tin nhắn mới (dùng chung cho /analyze và /report)
+transcripts = TranscriptCache(max_sessions=SESSION_MAX_COUNT)
+
+
+def _session_messages(session_id: str):
+    memory = session_store.get(session_id)
+    return None if memory is None else memory.messages_with_ids()
+
+
+async def load_transcript(session_id: str):
+    # Trả về (transcript, None) nếu đủ dữ liệu phân tích, ngược lại (None, thông báo lỗi)
+    loaded = await store_call(_session_messages, session_id)
+    if loaded is None:
+        return None, "Chưa có dữ liệu trò chuyện nào để phân tích!"
+
+    transcript = transcripts.get(session_id, *loaded)
+    if transcript.message_count < MIN_ANALYSIS_MESSAGES or transcript.char_count < MIN_ANALYSIS_CHARS:
+        return None, "Cuộc trò chuyện quá ngắn, chưa đủ dữ liệu phân tích."
+    return transcript, None
+
+
+async def analyze_transcript(inputs: dict, config=None):
+    # 1 lần phân tích: gọi Gemini (deadline + thử lại + cầu dao) rồi parse.
+    # JSON hỏng thì sửa từ chính câu trả lời này, không trả tiền cho 1 lần phân tích mới.
+    # Không tự xin slot llm_limiter: người gọi (run_talent_analysis / llm_limiter.batch) đã giữ slot.
+    analysis_chain = ai.analysis_chain
+    completion = await llm_caller.call(
+        lambda: analysis_chain.ainvoke(inputs, config=config), timeout=ANALYSIS_TIMEOUT_SECONDS
+    )
+    if isinstance(completion, dict):
+        # Chế độ structured: Gemini đã trả về object, chỉ phải sửa khi lệch schema
+        if completion["parsed"] is not None:
+            return output_repairer.accept(completion["parsed"])
+        completion = completion["raw"].text
+
+    async def fix(bad_completion: str, error: str) -> str:
+        fix_chain = ai.analysis_fix_chain
+        fix_config = {**(config or {}), "metadata": {**(config or {}).get("metadata", {}), "pipeline": "analysis_repair"}}
+        return await llm_caller.call(
+            lambda: fix_chain.ainvoke({"completion": bad_completion, "error": error}, config=fix_config)
+        )
+
+    return await output_repairer.parse(completion, fix, config=config)
+
+
+async def run_talent_analysis(session_id: str, child_age: int, transcript):
+    # Lịch sử chưa đổi thì dùng lại kết quả cũ
+    cached = analysis_cache.get(session_id, child_age, transcript.fingerprint)
+    if cached is not None:
+        return cached
+
+    async def analyze():
+        async with llm_limiter:
+            profile = await analyze_transcript({
+                "age": child_age,
+                "chat_history": transcript.text
+            }, config=run_config("analysis"))
+        analysis_cache.put(session_id, child_age, transcript.fingerprint, profile)
+        await store_call(session_store.save_profile, session_id, child_age, profile.dict())  # Lưu lại cho /export
+        return profile
+
+    # Bấm "Phân tích" liên tục, hoặc /analyze + /report cùng lúc -> chỉ 1 lần gọi Gemini
+    return await session_guard.coalesce(("analysis", session_id, child_age, transcript.fingerprint), analyze)
+
+
 # --- [NEW] API TẠO BÁO CÁO PDF ---
-@app.post("/report")
+@router.post("/report")
 async def generate_report_api(request: AnalyzeRequest):  # Tận dụng lại class AnalyzeRequest
     session_id = request.session_id
+    check_rate(session_id)
 
-    # 1. Gọi lại hàm phân tích (Hoặc lấy từ Cache nếu xịn, nhưng giờ gọi lại cho nhanh)
-    # (Copy logic từ hàm /analyze xuống đây hoặc tách hàm ra)
-    # ĐỂ ĐƠN GIẢN HÓA CHO BẠN: Tôi sẽ gọi lại logic phân tích
-    if session_id not in user_sessions:
-        return {"error": "Không tìm thấy dữ liệu."}
-
-    memory = user_sessions[session_id]
-    history_messages = memory.messages
-    
-    # Chuyển list tin nhắn thành text để AI đọc
-    history_text = ""
-    for msg in history_messages:
-        role = "Bé" if msg.type == "human" else "Thám tử"
-        history_text += f"{role}: {msg.content}\n"
-
-    # Gọi AI phân tích (Logic cũ)
-    analysis_chain = analysis_prompt | llm | parser
-    try:
-        profile = analysis_chain.invoke({
-            "age": request.child_age,
-            "chat_history": history_text
-        })
+    transcript, error = await load_transcript(session_id)
+    if error:
+        return {"error": error}
+
+    async def build_report():
+        # 1. Lấy hồ sơ đã phân tích từ Cache (nếu lịch sử chat chưa đổi), nếu không thì gọi AI
+        profile = await run_talent_analysis(session_id, request.child_age, transcript)
 
         # Chuyển đổi dữ liệu Pydantic sang Dict
         data = profile.dict()
         data['child_name'] = "Bé Bi"  # (Sau này lấy từ Frontend)
         data['age'] = request.child_age
 
-        # 2. Tạo file PDF trong bộ nhớ (BytesIO)
-        pdf_buffer = io.BytesIO()
-        create_talent_pdf(pdf_buffer, data)
-        pdf_buffer.seek(0)
+        # 2. Tạo file PDF trong pool riêng (không chặn event loop)
+        started = time.perf_counter()
+        pdf_bytes = await pdf_pool.render(data)
+        observe_stage("report", "pdf_render", time.perf_counter() - started)
+        return pdf_bytes
+
+    try:
+        # Bấm tải 2 lần với cùng dữ liệu -> chỉ render 1 file, cả 2 request nhận chung
+        pdf_bytes = await session_guard.coalesce(
+            ("report", session_id, request.child_age, transcript.fingerprint), build_report
+        )
 
         # 3. Trả file về cho người dùng mà không lưu xuống đĩa
-        return StreamingResponse(
-            pdf_buffer,
+        return Response(
+            content=pdf_bytes,
             media_type='application/pdf',
             headers={"Content-Disposition": f"attachment; filename=Ho_So_Tai_Nang_KidTalent.pdf"}
         )
 
+    except PoolSaturated as e:
+        # Quá nhiều báo cáo đang chờ: báo client thử lại thay vì làm treo server
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except LLMUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi tạo báo cáo: {str(e)}")
 
-@app.post("/analyze")  # Không cần response_model vì nó trả về JSON động
-async def analyze_talent(request: AnalyzeRequest):
-    session_id = request.session_id
+# --- API BÁO CÁO CHẠY NỀN (JOB) ---
+# POST /reports trả job_id ngay; client hỏi trạng thái bằng GET /reports/{id} rồi tải
+# GET /reports/{id}/pdf khi xong. Không giữ kết nối HTTP mở suốt 1 lần phân tích + render.
+class ReportJobRequest(AnalyzeRequest):
+    child_name: Optional[str] = None
+
+
+def report_key(request: ReportJobRequest, transcript) -> str:
+    # Cùng hội thoại + tuổi + tên -> cùng file PDF (dùng lại, và làm ETag)
+    raw = f"{request.session_id}\x00{request.child_age}\x00{request.child_name or ''}\x00{transcript.fingerprint}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:40]
 
-    # Kiểm tra xem bé này có lịch sử chat chưa
-    if session_id not in user_sessions:
-        return {"error": "Chưa có dữ liệu trò chuyện nào để phân tích!"}
 
-    # Lấy toàn bộ lịch sử chat từ bộ nhớ
-    memory = user_sessions[session_id]
-    history_messages = memory.messages
-    
-    # Chuyển list tin nhắn thành text để AI đọc
-    history_text = ""
-    for msg in history_messages:
-        role = "Bé" if msg.type == "human" else "Thám tử"
-        history_text += f"{role}: {msg.content}\n"
+async def render_report_job(payload: dict) -> bytes:
+    transcript, error = await load_transcript(payload["session_id"])
+    if error:
+        raise ValueError(error)
+    profile = await run_talent_analysis(payload["session_id"], payload["child_age"], transcript)
+    data = profile.dict()
+    data['child_name'] = payload["child_name"] or "Bé Bi"
+    data['age'] = payload["child_age"]
 
-    if not history_text.strip():
-        return {"error": "Cuộc trò chuyện quá ngắn, chưa đủ dữ liệu phân tích."}
+    # Job chạy nền nên chờ được: pool PDF đầy thì đợi rồi thử lại thay vì báo lỗi
+    for attempt in range(10):
+        try:
+            started = time.perf_counter()
+            pdf_bytes = await pdf_pool.render(data)
+            observe_stage("report_job", "pdf_render", time.perf_counter() - started)
+            return pdf_bytes
+        except PoolSaturated:
+            await asyncio.sleep(min(5, 0.5 * 2 ** attempt))
+    raise PoolSaturated("Máy tạo PDF đang quá tải, vui lòng thử lại sau.")
 
-    print(f"--- Đang phân tích hồ sơ bé {session_id} ---")
 
-    # Tạo Chain phân tích
-    analysis_chain = analysis_prompt | llm | parser
+report_jobs = ReportJobQueue(
+    ReportStore(REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_BYTES, ttl_seconds=REPORT_CACHE_TTL),
+    render_report_job,
+    workers=REPORT_JOB_WORKERS,
+    max_queued=REPORT_JOB_MAX_QUEUED,
+)
+
+
+def job_response(job: dict) -> dict:
+    body = public_job(job)
+    body.pop("key", None)
+    body["status_url"] = f"/reports/{job['job_id']}"
+    if job["status"] == "done":
+        body["pdf_url"] = f"/reports/{job['job_id']}/pdf"
+    return body
 
+
+@router.post("/reports", status_code=202)
+async def submit_report(request: ReportJobRequest):
+    check_rate(request.session_id)
+    transcript, error = await load_transcript(request.session_id)
+    if error:
+        return JSONResponse(status_code=422, content={"error": error})
     try:
-        # Gọi AI thực hiện phân tích
-        result = analysis_chain.invoke({
-            "age": request.child_age,
-            "chat_history": history_text
+        job = report_jobs.submit(report_key(request, transcript), {
+            "session_id": request.session_id,
+            "child_age": request.child_age,
+            "child_name": request.child_name,
         })
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return job_response(job)
+
+
+@router.get("/reports/{job_id}")
+async def get_report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy báo cáo (có thể đã hết hạn).")
+    return job_response(job)
+
+
+@router.get("/reports/{job_id}/pdf")
+async def download_report(job_id: str, request: Request):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy báo cáo (có thể đã hết hạn).")
+    if job["status"] != "done":
+        return JSONResponse(status_code=409, content=job_response(job))
+
+    path = report_jobs.store.pdf_path(job["key"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="File báo cáo đã bị dọn, vui lòng tạo lại.")
+
+    # Khóa nội dung cố định cho mỗi file -> dùng làm ETag; trình duyệt đã có thì trả 304
+    etag = f'"{job["key"]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/pdf", filename="Ho_So_Tai_Nang_KidTalent.pdf", headers=headers)
+
+
+@router.post("/analyze")  # Không cần response_model vì nó trả về JSON động
+async def analyze_talent(request: AnalyzeRequest):
+    session_id = request.session_id
+    check_rate(session_id)
+
+    # Kiểm tra xem bé này có lịch sử chat chưa và đã đủ dài để phân tích chưa
+    transcript, error = await load_transcript(session_id)
+    if error:
+        return {"error": error}
+
+    logger.info("--- Đang phân tích hồ sơ bé %s ---", session_id)
+
+    try:
+        # Gọi AI thực hiện phân tích (hoặc lấy từ Cache)
+        result = await run_talent_analysis(session_id, request.child_age, transcript)
 
         # Kết quả 'result' lúc này đã là một object Python (TalentProfile)
         # Chúng ta chuyển nó thành JSON (dict) để trả về cho Frontend
@@ -202,19 +766,304 @@ async def analyze_talent(request: AnalyzeRequest):
     except Exception as e:
         return {"error": f"Lỗi phân tích: {str(e)}"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_memory(request: ChatRequest):
-    # --- GỌI AI TRẢ LỜI ---
+# --- API PHÂN TÍCH CẢ LỚP ---
+class BatchAnalyzeItem(AnalyzeRequest):
+    child_name: Optional[str] = None
+
+
+class BatchAnalyzeRequest(BaseModel):
+    items: List[BatchAnalyzeItem]
+    output: Optional[Literal["pdf", "zip"]] = None  # None: chỉ trả JSON; "pdf": 1 file chung; "zip": mỗi bé 1 file
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest):
+    items = request.items
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Số bé mỗi lần phải từ 1 đến {BATCH_MAX_ITEMS}.")
+
+    # 1. Kiểm tra dữ liệu + lấy từ Cache; chỉ những bé còn lại mới cần gọi AI
+    results = [None] * len(items)  # Talent_profile hoặc chuỗi lỗi
+    todo = []
+    for i, item in enumerate(items):
+        transcript, error = await load_transcript(item.session_id)
+        if error:
+            results[i] = error
+            continue
+        cached = analysis_cache.get(item.session_id, item.child_age, transcript.fingerprint)
+        if cached is not None:
+            results[i] = cached
+        else:
+            todo.append((i, transcript))
+
+    # 2. Phân tích song song bằng abatch; 1 bé lỗi không làm hỏng cả lớp
+    if todo:
+        logger.info("--- Đang phân tích %d hồ sơ theo lô ---", len(todo))
+        outputs = await llm_limiter.batch(
+            RunnableLambda(analyze_transcript),
+            [{"age": items[i].child_age, "chat_history": transcript.text} for i, transcript in todo],
+            BATCH_MAX_CONCURRENCY,
+            config=run_config("batch_analysis")
+        )
+        for (i, transcript), output in zip(todo, outputs):
+            if isinstance(output, Exception):
+                results[i] = f"Lỗi phân tích: {str(output)}"
+            else:
+                analysis_cache.put(items[i].session_id, items[i].child_age, transcript.fingerprint, output)
+                await store_call(session_store.save_profile, items[i].session_id, items[i].child_age, output.dict())
+                results[i] = output
+
+    entries = []
+    report_data = []
+    report_entries = []  # report_data[k] là của entries[report_entries[k]]
+    for item, result in zip(items, results):
+        if isinstance(result, str):
+            entries.append({"session_id": item.session_id, "error": result})
+            continue
+        entries.append({"session_id": item.session_id, "profile": result.dict()})
+        data = result.dict()
+        data['child_name'] = item.child_name or item.session_id
+        data['age'] = item.child_age
+        report_data.append(data)
+        report_entries.append(len(entries) - 1)
+
+    def summary():
+        succeeded = sum(1 for entry in entries if "error" not in entry)
+        return {"succeeded": succeeded, "failed": len(items) - succeeded, "results": entries}
+
+    body = summary()
+    if request.output is None:
+        return body
+    if not report_data:
+        return JSONResponse(status_code=422, content=body)
+
+    # Không chiếm quá số worker của pool để chừa chỗ cho các request /report khác
+    slots = asyncio.Semaphore(pdf_pool.max_workers)
+
+    async def render_one(data):
+        async with slots:
+            return await pdf_pool.render(data)
+
+    def drop_failed(pdfs):
+        # 1 bé render lỗi không làm hỏng cả lớp: ghi lỗi vào kết quả của bé đó như lỗi phân tích.
+        # Pool đầy thì vẫn báo 503 cho cả lô (thử lại sau là được).
+        for output in pdfs:
+            if isinstance(output, PoolSaturated):
+                raise output
+        kept = []
+        for data, entry_index, output in zip(report_data, report_entries, pdfs):
+            if isinstance(output, Exception):
+                logger.warning("Render PDF lỗi cho %s: %s", entries[entry_index]["session_id"], output)
+                entries[entry_index] = {"session_id": entries[entry_index]["session_id"],
+                                        "error": f"Lỗi tạo PDF: {str(output)}"}
+            else:
+                kept.append((data, output))
+        return kept
+
+    # 3. Xuất file: PDF gộp cả lớp hoặc ZIP mỗi bé 1 file
+    started = time.perf_counter()
     try:
-        # Sử dụng chain_with_history để tự động quản lý lịch sử theo session_id
-        reply_text = chain_with_history.invoke(
-            {"age": request.child_age, "user_message": request.user_message},
-            config={"configurable": {"session_id": request.session_id}}
+        if request.output == "pdf":
+            try:
+                pdf_bytes = await pdf_pool.render_many(report_data)
+            except PoolSaturated:
+                raise
+            except Exception as e:
+                # Có bé làm hỏng file gộp: render riêng từng bé để tìm ra, rồi gộp lại những bé còn lại
+                logger.warning("Render PDF cả lớp lỗi, thử từng bé: %s", e)
+                kept = drop_failed(await asyncio.gather(*(render_one(data) for data in report_data),
+                                                        return_exceptions=True))
+                body = summary()
+                if not kept:
+                    return JSONResponse(status_code=422, content=body)
+                pdf_bytes = await pdf_pool.render_many([data for data, _ in kept])
+            observe_stage("batch", "pdf_render", time.perf_counter() - started)
+            return Response(
+                content=pdf_bytes,
+                media_type='application/pdf',
+                headers={
+                    "Content-Disposition": "attachment; filename=Ho_So_Tai_Nang_Ca_Lop.pdf",
+                    "X-Batch-Failed": str(body["failed"]),
+                }
+            )
+
+        kept = drop_failed(await asyncio.gather(*(render_one(data) for data in report_data), return_exceptions=True))
+        observe_stage("batch", "pdf_render", time.perf_counter() - started)
+        body = summary()
+        if not kept:
+            return JSONResponse(status_code=422, content=body)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for n, (data, pdf_bytes) in enumerate(kept, start=1):
+                safe_name = re.sub(r"[^\w-]+", "_", str(data['child_name']))
+                archive.writestr(f"{n:03d}_Ho_So_{safe_name}.pdf", pdf_bytes)
+            archive.writestr("ket_qua.json", json.dumps(body, ensure_ascii=False, indent=2))
+        return Response(
+            content=buffer.getvalue(),
+            media_type='application/zip',
+            headers={
+                "Content-Disposition": "attachment; filename=Ho_So_Tai_Nang_Ca_Lop.zip",
+                "X-Batch-Failed": str(body["failed"]),
+            }
         )
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+# --- API XUẤT DỮ LIỆU (NDJSON) CHO NHÓM PHÂN TÍCH ---
+# Mỗi dòng 1 phiên: tin nhắn + hồ sơ mới nhất. Truyền lại X-Export-Cursor của lần trước vào ?since=
+# để chỉ lấy các phiên đã thay đổi. Gửi từng khối (chunked), không dựng cả file trong RAM.
+@router.get("/export")
+async def export_sessions(request: Request, since: int = 0, gzip: bool = False, messages: bool = True):
+    if EXPORT_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Chưa bật xuất dữ liệu (EXPORT_TOKEN).")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {EXPORT_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Sai token xuất dữ liệu.")
+
+    until = await store_call(session_store.export_cursor)
+    chunks = iter_ndjson(export_records(session_store, since, until, include_messages=messages), compress=gzip)
+    if SESSION_BACKEND != "sqlite":
+        # Kho RAM: đọc ngay trên event loop (dict không an toàn khi luồng khác đang sửa),
+        # nhường event loop sau mỗi khối ~64 KB để kho lớn không làm /chat bị đứng.
+        # Kho SQLite: để nguyên generator thường -> Starlette chạy trong threadpool, không chặn event loop.
+        sync_chunks = chunks
+
+        async def on_loop():
+            for chunk in sync_chunks:
+                yield chunk
+                await asyncio.sleep(0)
+
+        chunks = on_loop()
+
+    filename = f"kidtalent_export_{since}_{until}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Export-Cursor": str(until)}
+    )
+
+
+async def cached_chat_reply(request: ChatRequest):
+    # Trả về (khóa cache, câu trả lời đã cache). Khóa None = lượt này không cache được.
+    # Khi hit: tự ghi lượt chat vào lịch sử (như RunnableWithMessageHistory vẫn làm) rồi bỏ qua Gemini.
+    if not response_cache.enabled:
+        return None, None
+    history = get_session_history(request.session_id)
+    key = response_cache.key(request.child_age, await history.aget_messages(), request.user_message)
+    if key is None:
+        return None, None
+    reply = await response_cache.aget(key)
+    if reply is not None:
+        await history.aadd_messages([HumanMessage(content=request.user_message), AIMessage(content=reply)])
+        analysis_cache.invalidate(request.session_id)
+    return key, reply
 
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_with_memory(request: ChatRequest):
+    check_rate(request.session_id)
+
+    async def reply():
+        # Lượt chat cùng phiên chạy lần lượt: lượt sau đọc lịch sử đã có câu trả lời của lượt trước
+        async with session_guard.lock(request.session_id):
+            cache_key, cached_reply = await cached_chat_reply(request)
+            if cached_reply is not None:
+                return ChatResponse(ai_reply=cached_reply, cached=True)
+
+            # Sử dụng chain có lịch sử (ai.chat_chain) để tự động quản lý lịch sử theo session_id.
+            # Lượt lỗi/quá hạn không được lưu vào lịch sử -> thử lại an toàn.
+            started = time.perf_counter()
+            async with llm_limiter:
+                reply_text = await llm_caller.call(lambda: ai.chat_chain.ainvoke(
+                    {"age": request.child_age, "user_message": request.user_message},
+                    config=run_config("chat", request.session_id)
+                ))
+            if cache_key is not None:
+                await response_cache.aput(cache_key, reply_text, time.perf_counter() - started)
+            # Có tin nhắn mới -> hồ sơ phân tích cũ không còn đúng
+            analysis_cache.invalidate(request.session_id)
         return ChatResponse(ai_reply=reply_text)
 
+    # --- GỌI AI TRẢ LỜI ---
+    try:
+        # Bấm gửi 2 lần (cùng tin nhắn, lượt trước chưa xong) -> 1 lượt chat, 2 request nhận chung câu trả lời
+        return await session_guard.coalesce(
+            ("chat", request.session_id, request.child_age, request.user_message), reply
+        )
+
+    except LLMUnavailable as e:
+        # Không trả lỗi dưới dạng câu trả lời của Thám tử: client biết mà thử lại
+        raise HTTPException(status_code=503, detail=f"Thám tử đang mất trí nhớ tạm thời... ({str(e)})",
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        return ChatResponse(ai_reply=f"Thám tử đang mất trí nhớ tạm thời... (Lỗi: {str(e)})")
+        raise HTTPException(status_code=500, detail=f"Lỗi trò chuyện: {str(e)}")
+
+
+def _sse(data: dict, event: str = None) -> str:
+    # Đóng gói 1 sự kiện theo chuẩn Server-Sent Events
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+# --- API CHAT DẠNG STREAM (SSE) ---
+# Gửi từng token ngay khi Gemini sinh ra. Lịch sử chỉ được lưu khi stream
+# hoàn tất (RunnableWithMessageHistory không lưu nếu stream lỗi hoặc bị ngắt).
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    check_rate(request.session_id)  # Kiểm tra trước khi mở stream để trả đúng mã 429
+
+    async def event_stream():
+        started = time.perf_counter()
+        ttft_ms = None
+        try:
+            async with session_guard.lock(request.session_id):
+                cache_key, cached_reply = await cached_chat_reply(request)
+                if cached_reply is not None:
+                    yield _sse({"token": cached_reply})
+                    total_ms = round((time.perf_counter() - started) * 1000, 1)
+                    yield _sse({"ttft_ms": total_ms, "total_ms": total_ms, "cached": True}, event="done")
+                    return
+
+                tokens = []
+                async with llm_limiter:
+                    async for token in llm_caller.stream(lambda: ai.chat_chain.astream(
+                        {"age": request.child_age, "user_message": request.user_message},
+                        config=run_config("chat_stream", request.session_id)
+                    )):
+                        if not token:
+                            continue
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - started) * 1000
+                        tokens.append(token)
+                        yield _sse({"token": token})
+                if cache_key is not None:
+                    await response_cache.aput(cache_key, "".join(tokens), time.perf_counter() - started)
+                analysis_cache.invalidate(request.session_id)
+
+            total_ms = (time.perf_counter() - started) * 1000
+            yield _sse({"ttft_ms": round(ttft_ms or total_ms, 1), "total_ms": round(total_ms, 1)}, event="done")
+        except Exception as e:
+            yield _sse({"error": f"Thám tử đang mất trí nhớ tạm thời... (Lỗi: {str(e)})"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def create_app(llm=None) -> FastAPI:
+    # Application factory: uvicorn main:app hoặc uvicorn main:create_app --factory
+    if llm is not None:
+        ai.use_llm(llm)
+    application = FastAPI(title="KidTalent AI - Có Trí Nhớ", lifespan=lifespan)
+    application.middleware("http")(measure_http_latency)
+    application.include_router(router)
+    return application
+
+
+app = create_app()
+startup_state["import_ms"] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
 
 # Chạy server: uvicorn main:app --reload
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, disable_created_metrics, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Bỏ các series *_created để /metrics gọn hơn
+disable_created_metrics()
+
+# Registry riêng của KidTalent (không lẫn metric mặc định của thư viện)
+REGISTRY = CollectorRegistry()
+
+# Chạy nhiều worker uvicorn (WEB_CONCURRENCY > 1): đặt biến môi trường PROMETHEUS_MULTIPROC_DIR
+# (thư mục trống, xóa sạch mỗi lần khởi động) TRƯỚC khi tiến trình chạy -> histogram/counter của mọi
+# worker được ghi ra file và /metrics cộng gộp lại. Không đặt thì mỗi lần scrape chỉ thấy số của
+# 1 worker. Riêng các gauge lấy từ /stats (StatsCollector) luôn là của worker đang trả lời scrape.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or None
+_extra_collectors = []
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "kidtalent_http_request_duration_seconds", "Thời gian xử lý HTTP request (tới khi gửi header)",
+    ["method", "route", "status"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+STAGE_SECONDS = Histogram(
+    "kidtalent_stage_duration_seconds", "Thời gian từng bước trong pipeline chat/analysis/report",
+    ["pipeline", "stage"], buckets=_LATENCY_BUCKETS, registry=REGISTRY,
+)
+STAGE_ERRORS = Counter(
+    "kidtalent_stage_errors_total", "Số lần 1 bước trong pipeline bị lỗi",
+    ["pipeline", "stage"], registry=REGISTRY,
+)
+LLM_TOKENS = Counter(
+    "kidtalent_llm_tokens_total", "Số token prompt/completion của các lời gọi LLM",
+    ["pipeline", "kind"], registry=REGISTRY,
+)
+
+# Tên run của LangChain -> tên bước trong metric
+# (StrOutputParser chỉ lấy text từ câu trả lời, PydanticOutputParser mới parse JSON -> 2 nhãn riêng,
+# không đếm "parse" 2 lần cho 1 lượt phân tích)
+_CHAIN_STAGES = {
+    "PromptTemplate": "prompt_format",
+    "compact_history": "history_compaction",
+    "PydanticOutputParser": "parse",
+    "StrOutputParser": "extract_text",
+}
+
+
+def observe_stage(pipeline: str, stage: str, seconds: float):
+    STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+
+
+# Callback đo thời gian các bước prompt / LLM / parser và đếm token.
+# Nhãn pipeline lấy từ metadata={"pipeline": ...} truyền vào config khi gọi chain.
+class MetricsCallbackHandler(BaseCallbackHandler):
+    run_inline = True  # Chạy ngay trong event loop, không đẩy sang thread (rẻ hơn)
+
+    def __init__(self):
+        self._runs = {}  # run_id -> (pipeline, stage, thời điểm bắt đầu)
+
+    def _start(self, run_id, metadata, stage):
+        pipeline = (metadata or {}).get("pipeline", "unknown")
+        self._runs[run_id] = (pipeline, stage, time.perf_counter())
+
+    def _end(self, run_id, error=False):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        pipeline, stage, started = run
+        observe_stage(pipeline, stage, time.perf_counter() - started)
+        if error:
+            STAGE_ERRORS.labels(pipeline, stage).inc()
+        return pipeline
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        stage = _CHAIN_STAGES.get(kwargs.get("name"))
+        if stage:
+            self._start(run_id, metadata, stage)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, "llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        pipeline = self._end(run_id)
+        if pipeline is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels(pipeline, "prompt").inc(usage.get("input_tokens", 0))
+                    LLM_TOKENS.labels(pipeline, "completion").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+
+# Xuất các số liệu sẵn có ở /stats (hàng đợi LLM, cache, phiên...) thành gauge lúc Prometheus scrape
+class StatsCollector:
+    def __init__(self, stats_fn):
+        self.stats_fn = stats_fn
+
+    def collect(self):
+        for section, values in self.stats_fn().items():
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                yield GaugeMetricFamily(f"kidtalent_{section}_{key}", f"{section}.{key} (xem /stats)", value=value)
+
+
+def register_collector(collector):
+    # Collector tự viết (vd. StatsCollector) cũng phải có mặt trong registry gộp của chế độ nhiều worker
+    REGISTRY.register(collector)
+    _extra_collectors.append(collector)
+
+
+def render_metrics():
+    if MULTIPROC_DIR is None:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    for collector in _extra_collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("kidtalent")
+
+
+class PoolSaturated(Exception):
+    """Hàng đợi tạo PDF đã đầy -> báo client thử lại sau (HTTP 503)."""
+
+
+# Tạo PDF (ReportLab, tốn CPU) trong pool riêng để event loop không bị chặn.
+# Số việc đang chờ + đang chạy bị giới hạn bởi max_pending (backpressure).
+class PdfRenderPool:
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, kind: str = "process"):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"PDF_POOL_KIND không hợp lệ: {kind!r} (chọn 'process' hoặc 'thread')")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.broken = 0  # Số lần 1 worker chết (OOM kill, segfault) làm hỏng cả pool -> đã tạo pool mới
+        self.last_error = None
+        self._executor = None
+
+    def _get_executor(self):
+        # Tạo pool khi cần lần đầu; mỗi tiến trình con chuẩn bị sẵn font/styles 1 lần
+        # (import reportlab muộn để không làm chậm lúc khởi động)
+        from report_generator import get_report_engine
+
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=get_report_engine)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf")
+        return self._executor
+
+    async def warm_up(self):
+        # Khởi động sẵn các worker (mỗi worker tự chuẩn bị font/styles) trước request đầu tiên
+        from report_generator import worker_ready
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, worker_ready) for _ in range(self.max_workers)))
+
+    async def render(self, data: dict) -> bytes:
+        from report_generator import render_pdf_bytes
+
+        return await self._submit(render_pdf_bytes, data)
+
+    async def render_many(self, data_list) -> bytes:
+        # Cả lớp trong 1 file PDF (tính là 1 việc trong hàng đợi)
+        from report_generator import render_class_pdf_bytes
+
+        return await self._submit(render_class_pdf_bytes, data_list)
+
+    async def _submit(self, fn, payload) -> bytes:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated(f"Đang có {self.pending} báo cáo chờ tạo, vui lòng thử lại sau.")
+
+        self.pending += 1
+        executor = self._get_executor()
+        try:
+            loop = asyncio.get_running_loop()
+            pdf_bytes = await loop.run_in_executor(executor, fn, payload)
+            self.completed += 1
+            return pdf_bytes
+        except BrokenProcessPool as e:
+            # ProcessPoolExecutor hỏng vĩnh viễn khi 1 worker chết -> bỏ pool này, lần sau tạo pool mới.
+            # Các việc đang chạy trên pool cũ cũng lỗi theo, chỉ việc đầu tiên gặp lỗi mới phải dọn.
+            if self._executor is executor:
+                self.broken += 1
+                self.last_error = str(e)
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                logger.error("Pool tạo PDF bị hỏng (worker chết), sẽ tạo lại: %s", e)
+            raise
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "broken": self.broken,
+            "last_error": self.last_error,
+        }
@@ -1,143 +1,214 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+import io
 import os
+from xml.sax.saxutils import escape
 import requests
 
 
+FONT_NAME = 'DejaVuSans'
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DejaVuSans.ttf")
+# URL từ repo chính thức của matplotlib (cực kỳ ổn định và chuẩn binary)
+FONT_URL = "https://raw.githubusercontent.com/matplotlib/matplotlib/main/lib/matplotlib/mpl-data/fonts/ttf/DejaVuSans.ttf"
+
+
+def _font_file_ok(font_path):
+    # Kiểm tra nếu file tồn tại nhưng bị hỏng (là file HTML hoặc quá nhỏ)
+    if not os.path.exists(font_path):
+        return False
+    # File font chuẩn phải nặng khoảng 700KB. Nếu < 100KB chắc chắn lỗi.
+    if os.path.getsize(font_path) < 100000:
+        return False
+    # Kiểm tra nội dung xem có phải HTML không
+    with open(font_path, 'rb') as f:
+        header = f.read(15)
+    return not (b"<!DOCTYPE" in header or b"<html" in header)
+
+
 # 1. HÀM TẢI FONT TIẾNG VIỆT (Tự động tải nếu thiếu)
-def setup_font():
-    # Lấy thư mục hiện tại của file report_generator.py (KidTalent-Backend)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    font_path = os.path.join(base_dir, "DejaVuSans.ttf")
-    
-    # URL từ repo chính thức của matplotlib (cực kỳ ổn định và chuẩn binary)
-    url = "https://raw.githubusercontent.com/matplotlib/matplotlib/main/lib/matplotlib/mpl-data/fonts/ttf/DejaVuSans.ttf"
-    
-    try:
-        # Kiểm tra nếu file tồn tại nhưng bị hỏng (là file HTML hoặc quá nhỏ)
-        is_corrupted = False
-        if os.path.exists(font_path):
-            file_size = os.path.getsize(font_path)
-            # File font chuẩn phải nặng khoảng 700KB. Nếu < 100KB chắc chắn lỗi.
-            if file_size < 100000:
-                is_corrupted = True
-            else:
-                # Kiểm tra nội dung xem có phải HTML không
-                with open(font_path, 'rb') as f:
-                    header = f.read(15)
-                    if b"<!DOCTYPE" in header or b"<html" in header:
-                        is_corrupted = True
+def setup_font(allow_download=True):
+    # Font đã đăng ký trong tiến trình này rồi thì không parse lại file TTF
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return FONT_NAME
 
+    try:
         # Nếu chưa có font hoặc font bị hỏng, tải lại từ nguồn tin cậy
-        if not os.path.exists(font_path) or is_corrupted:
-            if is_corrupted:
-                print(f"Phát hiện file font hiện tại bị hỏng (nội dung lỗi). Đang tải lại từ: {url}")
+        if not _font_file_ok(FONT_PATH):
+            if not allow_download:
+                print("Không có file font hợp lệ. Sử dụng font mặc định.")
+                return 'Helvetica'
+            if os.path.exists(FONT_PATH):
+                print(f"Phát hiện file font hiện tại bị hỏng (nội dung lỗi). Đang tải lại từ: {FONT_URL}")
             else:
-                print(f"Đang tải font hỗ trợ tiếng Việt vào: {font_path}...")
-            
-            r = requests.get(url, stream=True, timeout=20)
+                print(f"Đang tải font hỗ trợ tiếng Việt vào: {FONT_PATH}...")
+
+            r = requests.get(FONT_URL, stream=True, timeout=20)
             if r.status_code == 200:
-                with open(font_path, 'wb') as f:
+                with open(FONT_PATH, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
                         f.write(chunk)
                 print("Tải font chuẩn thành công!")
             else:
                 print(f"Không thể tải font (Status: {r.status_code}). Sử dụng font mặc định.")
                 return 'Helvetica'
-        
+
         # Đăng ký font với ReportLab
-        pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
-        return 'DejaVuSans'
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+        return FONT_NAME
     except Exception as e:
         print(f"Lỗi khi xử lý font: {e}. Sử dụng font mặc định.")
         return 'Helvetica'
 
 
-# 2. HÀM TẠO FILE PDF
+# 2. BỘ TẠO PDF: font + kiểu chữ chỉ chuẩn bị 1 lần, dùng lại cho mọi báo cáo
+class ReportEngine:
+    def __init__(self, font_name):
+        self.font_name = font_name
+
+        # Định nghĩa các kiểu chữ (Styles)
+        styles = getSampleStyleSheet()
+
+        # Kiểu Tiêu đề (To, Đậm, Giữa)
+        self.title_style = ParagraphStyle(
+            'TalentTitle',
+            parent=styles['Heading1'],
+            fontName=font_name,
+            fontSize=24,
+            alignment=1,  # Center
+            spaceAfter=30,
+            textColor=colors.HexColor("#2E86C1")  # Màu xanh TeenUp
+        )
+
+        # Kiểu Nội dung thường
+        self.normal_style = ParagraphStyle(
+            'TalentNormal',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=12,
+            leading=16,  # Khoảng cách dòng
+            spaceAfter=12
+        )
+
+        # Kiểu Tiêu đề con (Heading 2)
+        self.h2_style = ParagraphStyle(
+            'TalentH2',
+            parent=styles['Heading2'],
+            fontName=font_name,
+            fontSize=16,
+            textColor=colors.HexColor("#D35400"),  # Màu cam
+            spaceAfter=10,
+            spaceBefore=20
+        )
+
+        # Kiểu chân trang (nhỏ, xám, giữa)
+        self.footer_style = ParagraphStyle('Footer', parent=self.normal_style, fontSize=10, textColor=colors.grey,
+                                           alignment=1)
+
+    @staticmethod
+    def _new_doc(output):
+        # Cấu hình trang giấy
+        return SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+    def render(self, output, data):
+        # Xây dựng file
+        self._new_doc(output).build(self._story(data))
+        return output
+
+    def render_many(self, output, data_list):
+        # Gộp hồ sơ của cả lớp vào 1 file, mỗi bé bắt đầu ở trang mới
+        story = []
+        for i, data in enumerate(data_list):
+            if i:
+                story.append(PageBreak())
+            story.extend(self._story(data))
+        self._new_doc(output).build(story)
+        return output
+
+    def _story(self, data):
+        title_style, normal_style, h2_style = self.title_style, self.normal_style, self.h2_style
+
+        # --- NỘI DUNG PDF ---
+        story = []
+
+        # 1. Tiêu đề
+        story.append(Paragraph("HỒ SƠ TÀI NĂNG TRẺ", title_style))
+        story.append(Spacer(1, 12))
+
+        # Tên bé (từ request) và nội dung do AI viết là text thường: escape trước khi đưa vào markup của Paragraph
+        # ("An <b>" hay "Bi & Bo" không được làm hỏng cả báo cáo)
+        # 2. Lời dẫn
+        intro = f"Báo cáo phân tích dành cho bé: <b>{escape(str(data.get('child_name', 'Bé Yêu')))}</b> ({escape(str(data.get('age', 8)))} tuổi)"
+        story.append(Paragraph(intro, normal_style))
+        story.append(Spacer(1, 12))
+
+        # 3. Kết quả phân tích
+        story.append(Paragraph("Tóm tắt tài năng", h2_style))
+        story.append(Paragraph(escape(data.get('summary', 'Chưa có tóm tắt.')), normal_style))
+
+        story.append(Paragraph("1. Trí thông minh nổi trội", h2_style))
+        story.append(Paragraph(escape(data['dominant_intelligence']), normal_style))
+
+        story.append(Paragraph("2. Tính cách đặc trưng", h2_style))
+        # Nối danh sách tính cách thành chuỗi
+        traits = escape(", ".join(data['personality_traits']))
+        story.append(Paragraph(traits, normal_style))
+
+        story.append(Paragraph("3. Nghề nghiệp tương lai gợi ý", h2_style))
+        for job in data['suggested_careers']:
+            story.append(Paragraph(f"• {escape(job)}", normal_style))
+
+        story.append(Paragraph("4. Lời khuyên cho Phụ huynh", h2_style))
+        story.append(Paragraph(escape(data['advice_for_parents']), normal_style))
+
+        story.append(Spacer(1, 40))
+
+        # 5. Footer (Quảng cáo khéo léo cho TeenUp)
+        footer = "Báo cáo được tạo bởi hệ thống AI của <b>KidTalent</b>."
+        story.append(Paragraph(footer, self.footer_style))
+        return story
+
+
+_engine = None
+
+
+def warm_up_report_engine():
+    # Gọi 1 lần lúc khởi động server: được phép tải font qua mạng nếu thiếu
+    global _engine
+    _engine = ReportEngine(setup_font(allow_download=True))
+    return _engine
+
+
+def get_report_engine():
+    # Trên đường xử lý request tuyệt đối không truy cập mạng
+    global _engine
+    if _engine is None:
+        _engine = ReportEngine(setup_font(allow_download=False))
+    return _engine
+
+
+# 3. HÀM TẠO FILE PDF
 def create_talent_pdf(output, data):
-    # Cấu hình trang giấy
-    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-
-    # Chuẩn bị font
-    font_name = setup_font()
-
-    # Định nghĩa các kiểu chữ (Styles)
-    styles = getSampleStyleSheet()
-
-    # Kiểu Tiêu đề (To, Đậm, Giữa)
-    title_style = ParagraphStyle(
-        'TalentTitle',
-        parent=styles['Heading1'],
-        fontName=font_name,
-        fontSize=24,
-        alignment=1,  # Center
-        spaceAfter=30,
-        textColor=colors.HexColor("#2E86C1")  # Màu xanh TeenUp
-    )
-
-    # Kiểu Nội dung thường
-    normal_style = ParagraphStyle(
-        'TalentNormal',
-        parent=styles['Normal'],
-        fontName=font_name,
-        fontSize=12,
-        leading=16,  # Khoảng cách dòng
-        spaceAfter=12
-    )
-
-    # Kiểu Tiêu đề con (Heading 2)
-    h2_style = ParagraphStyle(
-        'TalentH2',
-        parent=styles['Heading2'],
-        fontName=font_name,
-        fontSize=16,
-        textColor=colors.HexColor("#D35400"),  # Màu cam
-        spaceAfter=10,
-        spaceBefore=20
-    )
-
-    # --- NỘI DUNG PDF ---
-    story = []
-
-    # 1. Tiêu đề
-    story.append(Paragraph("HỒ SƠ TÀI NĂNG TRẺ", title_style))
-    story.append(Spacer(1, 12))
-
-    # 2. Lời dẫn
-    intro = f"Báo cáo phân tích dành cho bé: <b>{data.get('child_name', 'Bé Yêu')}</b> ({data.get('age', 8)} tuổi)"
-    story.append(Paragraph(intro, normal_style))
-    story.append(Spacer(1, 12))
-
-    # 3. Kết quả phân tích
-    story.append(Paragraph("Tóm tắt tài năng", h2_style))
-    story.append(Paragraph(data.get('summary', 'Chưa có tóm tắt.'), normal_style))
-
-    story.append(Paragraph("1. Trí thông minh nổi trội", h2_style))
-    story.append(Paragraph(data['dominant_intelligence'], normal_style))
-
-    story.append(Paragraph("2. Tính cách đặc trưng", h2_style))
-    # Nối danh sách tính cách thành chuỗi
-    traits = ", ".join(data['personality_traits'])
-    story.append(Paragraph(traits, normal_style))
-
-    story.append(Paragraph("3. Nghề nghiệp tương lai gợi ý", h2_style))
-    for job in data['suggested_careers']:
-        story.append(Paragraph(f"• {job}", normal_style))
-
-    story.append(Paragraph("4. Lời khuyên cho Phụ huynh", h2_style))
-    story.append(Paragraph(data['advice_for_parents'], normal_style))
-
-    story.append(Spacer(1, 40))
-
-    # 5. Footer (Quảng cáo khéo léo cho TeenUp)
-    footer = "Báo cáo được tạo bởi hệ thống AI của <b>KidTalent</b>."
-    story.append(Paragraph(footer, ParagraphStyle('Footer', parent=normal_style, fontSize=10, textColor=colors.grey,
-                                                  alignment=1)))
-
-    # Xây dựng file
-    doc.build(story)
-    return output
\ No newline at end of file
+    return get_report_engine().render(output, data)
+
+
+def worker_ready():
+    # Dùng để khởi động sẵn worker của pool (font/styles đã được initializer chuẩn bị)
+    return get_report_engine().font_name
+
+
+def render_pdf_bytes(data):
+    # Hàm dùng cho process pool: nhận dict thuần, trả về bytes của file PDF
+    buffer = io.BytesIO()
+    create_talent_pdf(buffer, data)
+    return buffer.getvalue()
+
+
+def render_class_pdf_bytes(data_list):
+    # Giống render_pdf_bytes nhưng gộp nhiều hồ sơ vào 1 file PDF
+    buffer = io.BytesIO()
+    get_report_engine().render_many(buffer, data_list)
+    return buffer.getvalue()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger("kidtalent.reports")
+
+RESTART_ERROR = "Máy chủ vừa khởi động lại, vui lòng tạo lại báo cáo."
+
+
+class JobQueueFull(Exception):
+    """Hàng đợi báo cáo đã đầy -> báo client thử lại sau (HTTP 503)."""
+
+
+# Lưu trên đĩa: file PDF đã render (theo khóa nội dung) + trạng thái job (JSON).
+# Nằm trên đĩa nên mọi worker uvicorn đều trả lời được /reports/{id}, và file được phục vụ
+# thẳng từ đĩa (Content-Length, ETag) thay vì giữ bytes trong RAM.
+# Giới hạn tổng dung lượng PDF + thời gian sống; dọn sau mỗi lần ghi.
+class ReportStore:
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evicted = 0
+        self._pdf_dir = os.path.join(directory, "pdf")
+        self._job_dir = os.path.join(directory, "jobs")
+        os.makedirs(self._pdf_dir, exist_ok=True)
+        os.makedirs(self._job_dir, exist_ok=True)
+
+    def pdf_path(self, key: str) -> str:
+        return os.path.join(self._pdf_dir, f"{key}.pdf")
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self._job_dir, f"{job_id}.json")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        # Ghi file tạm rồi đổi tên: worker khác không bao giờ đọc phải file ghi dở
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _fresh(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < self.ttl_seconds
+        except FileNotFoundError:
+            return False
+
+    def has_pdf(self, key: str) -> bool:
+        return self._fresh(self.pdf_path(key))
+
+    def put_pdf(self, key: str, pdf_bytes: bytes):
+        self._write_atomic(self.pdf_path(key), pdf_bytes)
+        self.sweep()
+
+    def save_job(self, job: dict):
+        self._write_atomic(self._job_path(job["job_id"]), json.dumps(job, ensure_ascii=False).encode("utf-8"))
+
+    def load_job(self, job_id: str):
+        path = self._job_path(job_id)
+        if not self._fresh(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _scan(self, directory: str):
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # Worker khác vừa xóa
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self.evicted += 1
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        # Xóa file hết hạn, rồi xóa PDF cũ nhất cho tới khi tổng dung lượng <= max_bytes
+        cutoff = time.time() - self.ttl_seconds
+        for mtime, _, path in self._scan(self._job_dir):
+            if mtime < cutoff:
+                self._remove(path)
+        pdfs = []
+        for mtime, size, path in self._scan(self._pdf_dir):
+            if mtime < cutoff:
+                self._remove(path)
+            else:
+                pdfs.append((mtime, size, path))
+        total = sum(size for _, size, _ in pdfs)
+        for mtime, size, path in sorted(pdfs):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def stats(self):
+        pdfs = self._scan(self._pdf_dir)
+        return {
+            "pdf_files": len(pdfs),
+            "pdf_bytes": sum(size for _, size, _ in pdfs),
+            "max_bytes": self.max_bytes,
+            "evicted": self.evicted,
+        }
+
+
+# Hàng đợi job tạo báo cáo: POST trả job_id ngay, N worker nền lần lượt phân tích + render PDF.
+# Job trùng nội dung (cùng khóa) đang chờ/chạy thì dùng lại; PDF đã có sẵn trên đĩa thì xong ngay.
+class ReportJobQueue:
+    def __init__(self, store: ReportStore, render, workers: int = 4, max_queued: int = 100):
+        self.store = store
+        self._render = render  # async render(payload: dict) -> bytes
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue = asyncio.Queue()
+        self._jobs = {}    # job_id -> job (chỉ job đang chờ/chạy; job xong chỉ còn trên đĩa)
+        self._by_key = {}  # khóa nội dung -> job_id đang chờ/chạy
+        self._tasks = []
+        self.running = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.rejected = 0
+        self.done = 0
+        self.failed = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Job còn trong hàng đợi sẽ không bao giờ chạy -> ghi rõ để client không chờ mãi
+        for job in list(self._jobs.values()):
+            job.update(status="failed", error=RESTART_ERROR, finished_at=time.time())
+            self.store.save_job(public_job(job))
+        self._jobs.clear()
+        self._by_key.clear()
+
+    def submit(self, key: str, payload: dict) -> dict:
+        job_id = self._by_key.get(key)
+        if job_id is not None:
+            self.coalesced += 1
+            return self._jobs[job_id]
+
+        now = time.time()
+        job = {"job_id": uuid.uuid4().hex, "key": key, "status": "queued", "error": None,
+               "created_at": now, "finished_at": None, "size": None}
+        if self.store.has_pdf(key):
+            self.cache_hits += 1
+            job.update(status="done", finished_at=now, size=os.path.getsize(self.store.pdf_path(key)))
+            self.store.save_job(job)
+            return job
+
+        if self._queue.qsize() >= self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull(f"Đang có {self._queue.qsize()} báo cáo chờ tạo, vui lòng thử lại sau.")
+
+        self.submitted += 1
+        job["payload"] = payload
+        self._jobs[job["job_id"]] = job
+        self._by_key[key] = job["job_id"]
+        self.store.save_job(public_job(job))
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return self.store.load_job(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            self.store.save_job(public_job(job))
+            self.running += 1
+            try:
+                pdf_bytes = await self._render(job["payload"])
+                await asyncio.to_thread(self.store.put_pdf, job["key"], pdf_bytes)
+                job.update(status="done", size=len(pdf_bytes))
+                self.done += 1
+            except asyncio.CancelledError:
+                job.update(status="failed", error=RESTART_ERROR)
+                raise
+            except Exception as e:
+                logger.warning("Job báo cáo %s lỗi: %s", job_id, e)
+                job.update(status="failed", error=str(e))
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job["finished_at"] = time.time()
+                self.store.save_job(public_job(job))
+                self._jobs.pop(job_id, None)
+                self._by_key.pop(job["key"], None)
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "done": self.done,
+            "failed": self.failed,
+            **self.store.stats(),
+        }
+
+
+def public_job(job: dict) -> dict:
+    # Bỏ dữ liệu nội bộ (payload) trước khi lưu/trả về cho client
+    return {k: v for k, v in job.items() if k != "payload"}
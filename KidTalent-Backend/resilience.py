@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import random
+import time
+
+from langchain_core.exceptions import (
+    ModelAPIError,
+    ModelConnectionError,
+    ModelRateLimitError,
+    ModelTimeoutError,
+    OutputParserException,
+)
+
+logger = logging.getLogger("kidtalent.resilience")
+
+
+class LLMUnavailable(Exception):
+    """Gemini lỗi liên tục, quá chậm hoặc cầu dao đang mở -> báo client thử lại sau (HTTP 503)."""
+
+    def __init__(self, message: str, retry_after: float = 5):
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class CircuitOpen(LLMUnavailable):
+    """Cầu dao đang mở: không gọi Gemini, trả lỗi ngay."""
+
+
+# Lỗi "tạm thời" đáng thử lại: quá hạn, mất kết nối, 429 và lỗi 5xx phía Google.
+# Lỗi do chính request (400, 401, 403, 404...) thử lại cũng vô ích.
+_TRANSIENT_TYPES = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    ModelAPIError,
+    ModelConnectionError,
+    ModelRateLimitError,
+    ModelTimeoutError,
+)
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(exc: BaseException) -> bool:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, _TRANSIENT_TYPES):
+            return True
+        if getattr(exc, "code", None) in _TRANSIENT_CODES or getattr(exc, "status_code", None) in _TRANSIENT_CODES:
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def _describe(exc: BaseException) -> str:
+    if isinstance(exc, asyncio.TimeoutError):
+        return "quá thời gian chờ"
+    return str(exc) or type(exc).__name__
+
+
+# Cầu dao: lỗi tạm thời liên tiếp >= ngưỡng thì "mở" -> mọi lời gọi bị từ chối ngay trong
+# reset_timeout giây (không xếp hàng chờ 1 upstream đang sập). Hết thời gian thì cho 1 lời gọi
+# thử (half_open): thành công -> đóng lại, lỗi -> mở tiếp.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold phải >= 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0       # Số lỗi tạm thời liên tiếp
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0       # Số lời gọi bị từ chối khi cầu dao mở
+        self._probe_in_flight = False
+
+    def before_call(self):
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen("Gemini đang tạm thời gián đoạn, vui lòng thử lại sau.", retry_after=remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpen("Gemini đang được kiểm tra lại, vui lòng thử lại sau.", retry_after=1)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.failures = 0
+        if self.state != "closed":
+            logger.warning("Cầu dao LLM đóng lại: Gemini đã phản hồi bình thường")
+            self.state = "closed"
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning("Cầu dao LLM mở sau %d lỗi liên tiếp, tạm ngừng gọi Gemini %.0fs",
+                           self.failures, self.reset_timeout)
+
+    def abandon(self):
+        # Lời gọi bị hủy giữa chừng (client ngắt kết nối): không tính là thành công hay lỗi
+        self._probe_in_flight = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "open": 0 if self.state == "closed" else 1,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+# Lớp gọi LLM "bền": deadline cho mỗi lần gọi, thử lại lỗi tạm thời với backoff lũy thừa
+# có jitter, và đi qua cầu dao. Chỉ bọc lời gọi; giới hạn song song vẫn do LLMLimiter lo.
+class ResilientCaller:
+    def __init__(self, breaker: CircuitBreaker, timeout: float, max_attempts: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+        if max_attempts < 1:
+            raise ValueError("max_attempts phải >= 1")
+        self.breaker = breaker
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.transient_errors = 0
+        self.failed = 0  # Số lời gọi bỏ cuộc (hết lượt thử hoặc cầu dao mở)
+
+    def backoff(self, attempt: int) -> float:
+        # "Full jitter": ngẫu nhiên trong [0, base * 2^(attempt-1)] để các request không thử lại cùng lúc
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _on_transient(self, exc: BaseException):
+        self.transient_errors += 1
+        if isinstance(exc, asyncio.TimeoutError):
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    def _give_up(self, exc: BaseException, attempt: int) -> LLMUnavailable:
+        self.failed += 1
+        return LLMUnavailable(f"Gemini không phản hồi sau {attempt} lần thử ({_describe(exc)})")
+
+    async def call(self, make_call, timeout: float = None):
+        """Chạy make_call() (hàm trả về coroutine, tạo mới cho mỗi lần thử) với deadline + thử lại."""
+        timeout = timeout or self.timeout
+        self.calls += 1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                self.failed += 1
+                raise
+            try:
+                result = await asyncio.wait_for(make_call(), timeout)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # Gemini vẫn trả lời (lỗi do request) -> upstream không sập
+                    self.breaker.record_success()
+                    raise
+                self._on_transient(e)
+                if attempt == self.max_attempts or self.breaker.state == "open":
+                    raise self._give_up(e, attempt) from e
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def stream(self, make_stream, timeout: float = None):
+        """Như call() nhưng cho stream: deadline áp cho từng chunk (kể cả chunk đầu).
+
+        Chỉ thử lại khi chưa gửi chunk nào cho client; lỗi giữa chừng thì báo lỗi luôn.
+        """
+        timeout = timeout or self.timeout
+        self.calls += 1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                self.failed += 1
+                raise
+            chunks = make_stream()
+            sent = False
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    sent = True
+                    yield chunk
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success()
+                    raise
+                self._on_transient(e)
+                if sent or attempt == self.max_attempts or self.breaker.state == "open":
+                    raise self._give_up(e, attempt) from e
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt))
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                await chunks.aclose()
+
+    def stats(self):
+        return {
+            "timeout_s": self.timeout,
+            "max_attempts": self.max_attempts,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "transient_errors": self.transient_errors,
+            "failed": self.failed,
+        }
+
+
+def short_parse_error(error: Exception) -> str:
+    # Thông báo lỗi của PydanticOutputParser chép lại cả completion + link tài liệu -> chỉ giữ phần lỗi
+    text = str(error)
+    if "Got: " in text:
+        text = text.split("Got: ", 1)[1]
+    lines = [line.split(" [type=")[0].rstrip() for line in text.splitlines() if "http" not in line]
+    return "\n".join(line for line in lines if line.strip())[:500]
+
+
+def extract_json_block(text: str) -> str:
+    # Cắt phần nằm giữa "{" đầu tiên và "}" cuối cùng (bỏ lời dẫn/markdown thừa quanh JSON)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return text
+    return text[start:end + 1]
+
+
+# Parse JSON do LLM trả về; nếu hỏng thì sửa từ CHÍNH câu trả lời đó thay vì phân tích lại từ đầu:
+#   1. cắt lấy khối JSON (miễn phí)
+#   2. nhờ LLM sửa JSON theo thông báo lỗi (prompt ngắn, không gửi lại lịch sử chat)
+class OutputRepairer:
+    def __init__(self, parser):
+        self.parser = parser
+        self.parsed = 0
+        self.local_repairs = 0
+        self.llm_repairs = 0
+        self.failed = 0
+
+    def accept(self, result):
+        # Kết quả đã được parse sẵn ở nơi khác (vd. structured output của Gemini)
+        self.parsed += 1
+        return result
+
+    async def parse(self, completion: str, fix, config: dict = None):
+        """fix(completion, error) -> coroutine trả về chuỗi JSON đã sửa (1 lời gọi LLM ngắn)."""
+        try:
+            result = await self.parser.ainvoke(completion, config=config)
+            self.parsed += 1
+            return result
+        except OutputParserException as e:
+            error = e
+
+        block = extract_json_block(completion)
+        if block != completion:
+            try:
+                result = await self.parser.ainvoke(block, config=config)
+                self.local_repairs += 1
+                return result
+            except OutputParserException as e:
+                error = e
+
+        reason = short_parse_error(error)
+        logger.warning("JSON phân tích bị lỗi, nhờ LLM sửa lại: %s", reason.splitlines()[0])
+        fixed = await fix(completion, reason)
+        try:
+            result = await self.parser.ainvoke(fixed, config=config)
+        except OutputParserException:
+            self.failed += 1
+            raise
+        self.llm_repairs += 1
+        return result
+
+    def stats(self):
+        return {
+            "parsed": self.parsed,
+            "local_repairs": self.local_repairs,
+            "llm_repairs": self.llm_repairs,
+            "failed": self.failed,
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+_NOT_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    # "Chào Thám tử!!! 🐔" -> "chào thám tử": bỏ dấu câu/emoji, chữ thường, gộp khoảng trắng.
+    # Giữ dấu tiếng Việt vì "ma" và "mà" là 2 câu khác nhau.
+    text = unicodedata.normalize("NFC", str(text)).lower()
+    return _SPACES.sub(" ", _NOT_WORD.sub(" ", text)).strip()
+
+
+# Cache câu trả lời chat cho các câu mở đầu hay gặp ("Chào", "Con tên là ...", "Con 8 tuổi").
+# Khóa = nhóm tuổi + lịch sử ngắn + tin nhắn (đã chuẩn hóa); chỉ áp dụng cho vài lượt đầu và
+# tin nhắn ngắn, nơi nhiều bé gõ giống hệt nhau. Tầng 1: LRU trong RAM; tầng 2 (tùy chọn):
+# SQLite dùng chung giữa các worker và giữ được qua restart.
+class ResponseCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 86400, max_turn: int = 2,
+                 max_message_chars: int = 40, age_bucket_years: int = 2, namespace: str = "",
+                 db_path: str = None, db_max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_turn = max_turn
+        self.max_message_chars = max_message_chars
+        self.age_bucket_years = max(1, age_bucket_years)
+        self.namespace = namespace  # Đổi prompt -> đổi namespace -> không dùng lại câu trả lời cũ
+        self._entries = OrderedDict()  # key -> (hết hạn lúc, câu trả lời)
+        self._db = _SQLiteTier(db_path, db_max_entries) if db_path else None
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.skipped = 0  # Tin nhắn không đủ điều kiện cache (lượt muộn, tin dài)
+        self.evictions = 0
+        self.avg_llm_seconds = 0.0  # Độ trễ trung bình (EWMA) của 1 lượt gọi Gemini khi cache miss
+        self.latency_saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, age: int, history: Sequence[BaseMessage], message: str) -> Optional[str]:
+        """Khóa cache, hoặc None nếu lượt chat này không nên cache."""
+        if not self.enabled:
+            return None
+        normalized = normalize_text(message)
+        turn = sum(1 for m in history if m.type == "human")
+        if not normalized or turn >= self.max_turn or len(normalized) > self.max_message_chars:
+            self.skipped += 1
+            return None
+
+        bucket = age // self.age_bucket_years
+        parts = [self.namespace, str(bucket)]
+        parts.extend(f"{m.type}:{normalize_text(m.content)}" for m in history)
+        parts.append(normalized)
+        return hashlib.sha1("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._get_memory(key, now)
+        if entry is None and self._db is not None:
+            entry = self._from_db(key, self._db.get(key, now))
+        return self._result(key, entry)
+
+    async def aget(self, key: str) -> Optional[str]:
+        # Như get(), nhưng tầng SQLite (có thể chờ khóa ghi của worker khác) chạy trong thread,
+        # và chỉ khi tầng RAM không có -> event loop không bị chặn
+        now = time.time()
+        entry = self._get_memory(key, now)
+        if entry is None and self._db is not None:
+            entry = self._from_db(key, await asyncio.to_thread(self._db.get, key, now))
+        return self._result(key, entry)
+
+    def put(self, key: str, reply: str, llm_seconds: float = None):
+        # llm_seconds: thời gian lượt gọi Gemini vừa rồi -> ước lượng thời gian tiết kiệm mỗi lần hit
+        entry = self._put_memory(key, reply, llm_seconds)
+        if self._db is not None:
+            self._db.put(key, entry)
+
+    async def aput(self, key: str, reply: str, llm_seconds: float = None):
+        entry = self._put_memory(key, reply, llm_seconds)
+        if self._db is not None:
+            await asyncio.to_thread(self._db.put, key, entry)
+
+    def _get_memory(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < now:
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+        return entry
+
+    def _from_db(self, key: str, entry):
+        if entry is not None:
+            self.db_hits += 1
+            self._store(key, entry)
+        return entry
+
+    def _result(self, key: str, entry) -> Optional[str]:
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.latency_saved_seconds += self.avg_llm_seconds
+        return entry[1]
+
+    def _put_memory(self, key: str, reply: str, llm_seconds: float = None):
+        if llm_seconds is not None:
+            self.avg_llm_seconds = llm_seconds if not self.avg_llm_seconds else \
+                0.9 * self.avg_llm_seconds + 0.1 * llm_seconds
+        entry = (time.time() + self.ttl_seconds, reply)
+        self._store(key, entry)
+        return entry
+
+    def _store(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "db_entries": self._db.count() if self._db is not None else 0,
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "avg_llm_ms": round(self.avg_llm_seconds * 1000, 1),
+            "latency_saved_s": round(self.latency_saved_seconds, 3),
+        }
+
+
+class _SQLiteTier:
+    PRUNE_EVERY = 256  # Số lần ghi giữa 2 lần dọn mục hết hạn / vượt giới hạn
+
+    def __init__(self, db_path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key        TEXT PRIMARY KEY,
+                reply      TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at);
+        """)
+
+    def get(self, key: str, now: float):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, reply FROM response_cache WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, key: str, entry):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache(key, reply, expires_at) VALUES (?, ?, ?)",
+                (key, entry[1], entry[0])
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        # Vượt giới hạn -> bỏ các mục sắp hết hạn nhất (cũng là mục được ghi sớm nhất)
+        self._conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
@@ -16,3 +16,12 @@ class Talent_profile(BaseModel):
     advice_for_parents : str = Field(
         description= "Lời khuyên dành cho cha mẹ để giúp bé phát triển tài năng này."
     )
+
+
+# Mô tả định dạng rút gọn (thay cho JSON schema đầy đủ của PydanticOutputParser): chỉ tên trường, kiểu và ý nghĩa
+def compact_format_instructions(model) -> str:
+    lines = ["Chỉ trả về 1 object JSON (không kèm markdown hay lời dẫn) gồm đúng các khóa sau:"]
+    for name, field in model.model_fields.items():
+        kind = "danh sách chuỗi" if getattr(field.annotation, "__origin__", None) is list else "chuỗi"
+        lines.append(f'- "{name}" ({kind}): {field.description}')
+    return "\n".join(lines)
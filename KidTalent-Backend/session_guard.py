@@ -0,0 +1,126 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class RateLimited(Exception):
+    """Gửi quá nhanh (theo phiên hoặc toàn server) -> HTTP 429 kèm Retry-After."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Token bucket: mỗi giây nạp `rate` token, chứa tối đa `burst` token; mỗi request lấy 1 token.
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        # Số giây phải chờ tới khi có 1 token (0 = lấy được ngay)
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+# Bảo vệ từng phiên chat khỏi request trùng lặp (Streamlit chạy lại script, bấm 2 lần):
+# - lock(session_id): các lượt /chat cùng phiên chạy lần lượt, lịch sử không bị xen kẽ;
+# - coalesce(key, ...): request giống hệt nhau đang chạy (/analyze, /report) chờ chung 1 kết quả;
+# - check_rate(session_id): token bucket theo phiên + toàn server, vượt thì báo 429.
+# Chỉ có hiệu lực trong 1 tiến trình (mỗi worker uvicorn có bộ đếm riêng).
+class SessionGuard:
+    def __init__(self, session_rate_per_minute: float = 30, session_burst: int = 10,
+                 global_rate_per_second: float = 50, global_burst: int = 100, max_sessions: int = 10000):
+        self.session_rate = session_rate_per_minute / 60
+        self.session_burst = session_burst
+        self.max_sessions = max_sessions
+        self._global = TokenBucket(global_rate_per_second, global_burst) if global_rate_per_second > 0 else None
+        self._buckets = OrderedDict()  # session_id -> TokenBucket (LRU)
+        self._locks = {}               # session_id -> [asyncio.Lock, số request đang giữ/chờ]
+        self._inflight = {}            # khóa -> asyncio.Task đang chạy
+        self.lock_waits = 0
+        self.coalesced = 0
+        self.rate_limited_session = 0
+        self.rate_limited_global = 0
+
+    def check_rate(self, session_id: str):
+        now = time.monotonic()
+        bucket = None
+        session_wait = 0.0
+        if self.session_rate > 0:
+            bucket = self._buckets.get(session_id)
+            if bucket is None:
+                bucket = self._buckets[session_id] = TokenBucket(self.session_rate, self.session_burst)
+                while len(self._buckets) > self.max_sessions:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(session_id)
+            session_wait = bucket.wait_time(now)
+        global_wait = self._global.wait_time(now) if self._global is not None else 0.0
+
+        # Chỉ trừ token khi cả 2 tầng đều cho qua (request bị từ chối không tốn lượt)
+        if session_wait > 0:
+            self.rate_limited_session += 1
+            raise RateLimited("Bé gửi nhanh quá, Thám tử chưa kịp nghe hết!", math.ceil(session_wait))
+        if global_wait > 0:
+            self.rate_limited_global += 1
+            raise RateLimited("Máy chủ đang quá đông, vui lòng thử lại sau.", math.ceil(global_wait))
+        if bucket is not None:
+            bucket.take()
+        if self._global is not None:
+            self._global.take()
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        if entry[0].locked():
+            self.lock_waits += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            # Không còn ai dùng -> bỏ lock, dict không tăng theo số phiên đã từng chat
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(session_id, None)
+
+    async def coalesce(self, key, make_coro):
+        """Chạy make_coro() 1 lần cho mỗi khóa; request trùng khóa trong lúc đó chờ chung kết quả (hoặc lỗi)."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(make_coro())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: 1 client ngắt kết nối không hủy kết quả các client khác đang chờ
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Mọi client đã bỏ đi thì lỗi vẫn được "đọc", không bị log cảnh báo
+
+    def stats(self):
+        return {
+            "active_sessions": len(self._locks),
+            "lock_waits": self.lock_waits,
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "rate_limited_session": self.rate_limited_session,
+            "rate_limited_global": self.rate_limited_global,
+            "tracked_buckets": len(self._buckets),
+        }
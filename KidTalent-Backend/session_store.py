@@ -0,0 +1,568 @@
+import asyncio
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from pydantic import PrivateAttr
+
+EXPORT_PAGE_SIZE = 500  # Số phiên đọc mỗi lần khi xuất dữ liệu (bộ nhớ không tăng theo tổng số phiên)
+_history_generations = count(1)  # Mỗi history tạo mới (kể cả tạo lại cho cùng session_id) có số riêng, tăng dần
+
+
+# Lịch sử chat có giới hạn số tin nhắn: vượt ngưỡng thì bỏ bớt các lượt cũ nhất
+class BoundedChatMessageHistory(InMemoryChatMessageHistory):
+    max_messages: int = 0   # 0 = không giới hạn
+    trimmed_count: int = 0  # Tổng số tin nhắn đã bị cắt bỏ
+    content_chars: int = 0  # Tổng số ký tự đang lưu (ước lượng bộ nhớ)
+    offset: int = 0         # Số tin nhắn đã rời khỏi đầu danh sách (bị cắt hoặc clear), chỉ tăng
+    _generation: int = PrivateAttr(default_factory=lambda: next(_history_generations))
+    # Báo cho SessionStore biết phiên vừa đổi (cho xuất dữ liệu) kèm mức thay đổi (tin nhắn, ký tự, tin bị cắt)
+    _on_change: Any = PrivateAttr(default=None)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        before = self._counts()
+        for message in messages:
+            self.messages.append(message)
+            self.content_chars += len(str(message.content))
+        self._trim()
+        self._notify(before)
+
+    def clear(self) -> None:
+        before = self._counts()
+        self.offset += len(self.messages)
+        super().clear()
+        self.content_chars = 0
+        self._notify(before)
+
+    def _counts(self):
+        return len(self.messages), self.content_chars, self.trimmed_count
+
+    def _notify(self, before):
+        if self._on_change is not None:
+            self._on_change(*(after - old for after, old in zip(self._counts(), before)))
+
+    def _trim(self):
+        if not self.max_messages or len(self.messages) <= self.max_messages:
+            return
+        drop = len(self.messages) - self.max_messages
+        # Không để lịch sử bắt đầu bằng câu trả lời của Thám tử (giữ trọn lượt hỏi-đáp)
+        while drop < len(self.messages) and self.messages[drop].type != "human":
+            drop += 1
+        for message in self.messages[:drop]:
+            self.content_chars -= len(str(message.content))
+        del self.messages[:drop]
+        self.trimmed_count += drop
+        self.offset += drop
+
+    @property
+    def message_ids(self) -> List[tuple]:
+        # Mã vị trí của từng tin nhắn: tăng dần, không bao giờ dùng lại (kể cả khi phiên bị xóa rồi tạo lại)
+        # -> transcript/tóm tắt dựng dần biết chính xác tin nào đã bị cắt, không phải so nội dung
+        return [(self._generation, self.offset + i) for i in range(len(self.messages))]
+
+    def messages_with_ids(self):
+        return list(self.messages), self.message_ids
+
+
+# Kho lưu phiên chat trong bộ nhớ, có giới hạn:
+# - Tối đa max_sessions phiên (vượt thì bỏ phiên ít dùng nhất - LRU)
+# - Phiên không hoạt động quá idle_ttl_seconds sẽ bị xóa
+# - Mỗi phiên tối đa max_messages tin nhắn
+class SessionStore:
+    blocking_io = False  # Mọi thao tác chỉ chạm RAM -> gọi thẳng trên event loop
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl_seconds: float = 3600, max_messages: int = 200):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages = max_messages
+        # session_id -> (history, lần truy cập cuối). Thứ tự = thứ tự truy cập (cũ nhất ở đầu)
+        self._sessions = OrderedDict()
+        # session_id -> (số thứ tự thay đổi, thời điểm đổi). Thứ tự = thứ tự thay đổi (dùng cho xuất tăng dần)
+        self._changes = OrderedDict()
+        # Nhật ký (số thứ tự, session_id) tăng dần theo seq -> xuất dữ liệu bisect tới đúng trang cần đọc.
+        # Mục cũ (phiên đã đổi tiếp hoặc bị xóa) chỉ bị bỏ qua khi đọc, thỉnh thoảng dọn lại 1 lần.
+        self._change_log = []
+        self._profiles = {}  # session_id -> (tuổi, hồ sơ dạng dict, thời điểm phân tích)
+        self._seq = 0
+        # Tổng cộng dồn của các phiên đang lưu: stats() chạy trong threadpool (/stats, /metrics)
+        # nên không được duyệt _sessions trong lúc event loop đang sửa nó
+        self._message_total = 0
+        self._content_chars_total = 0
+        self._trimmed_total = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def get_session_history(self, session_id: str) -> BoundedChatMessageHistory:
+        # Hợp đồng giống hàm cũ: luôn trả về history, tạo mới nếu chưa có
+        history = self.get(session_id)
+        if history is None:
+            history = BoundedChatMessageHistory(max_messages=self.max_messages)
+            history._on_change = lambda *delta: self._changed(session_id, history, *delta)
+            self._sessions[session_id] = (history, time.monotonic())
+            self._evict_overflow()
+        return history
+
+    def get(self, session_id: str) -> Optional[BoundedChatMessageHistory]:
+        self.evict_expired()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        history = entry[0]
+        self._sessions[session_id] = (history, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        return history
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def evict_expired(self):
+        # Phiên cũ nhất luôn ở đầu -> dừng ngay khi gặp phiên còn hạn
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._sessions:
+            session_id, (history, last_seen) = next(iter(self._sessions.items()))
+            if last_seen >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._forget(session_id, history)
+            self.evicted_idle += 1
+
+    def _evict_overflow(self):
+        while len(self._sessions) > self.max_sessions:
+            session_id, (history, _) = self._sessions.popitem(last=False)
+            self._forget(session_id, history)
+            self.evicted_lru += 1
+
+    def _forget(self, session_id: str, history: BoundedChatMessageHistory):
+        self._changes.pop(session_id, None)
+        self._profiles.pop(session_id, None)
+        self._count(-len(history.messages), -history.content_chars, -history.trimmed_count)
+
+    def _changed(self, session_id: str, history: BoundedChatMessageHistory, messages: int, content_chars: int,
+                 trimmed: int):
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[0] is not history:
+            return  # Lượt chat đang chạy trên history của phiên đã bị xóa -> không tính nữa
+        self._count(messages, content_chars, trimmed)
+        self._touch(session_id)
+
+    def _count(self, messages: int, content_chars: int, trimmed: int):
+        self._message_total += messages
+        self._content_chars_total += content_chars
+        self._trimmed_total += trimmed
+
+    def _touch(self, session_id: str):
+        # Lượt chat đang chạy vẫn giữ history của phiên vừa bị xóa (LRU/hết hạn) -> không ghi nhận nữa
+        if session_id not in self._sessions:
+            return
+        self._seq += 1
+        self._changes[session_id] = (self._seq, time.time())
+        self._changes.move_to_end(session_id)
+        self._change_log.append((self._seq, session_id))
+        if len(self._change_log) > 2 * len(self._changes) + 1024:
+            # _changes đã xếp theo seq -> dựng lại nhật ký chỉ gồm các mục còn hiệu lực
+            self._change_log = [(seq, sid) for sid, (seq, _) in self._changes.items()]
+
+    def save_profile(self, session_id: str, child_age: int, profile: dict):
+        # Lưu hồ sơ phân tích mới nhất của phiên (để xuất cho nhóm phân tích dữ liệu)
+        if session_id not in self._sessions:
+            return
+        self._profiles[session_id] = (child_age, profile, time.time())
+        self._touch(session_id)
+
+    def export_cursor(self) -> int:
+        return self._seq
+
+    def iter_changed(self, since: int, until: int, include_messages: bool = True, page_size: int = EXPORT_PAGE_SIZE):
+        """Các phiên có thay đổi trong khoảng (since, until], theo thứ tự thay đổi, đọc từng trang."""
+        while True:
+            # Mỗi trang bisect lại theo seq (không giữ vị trí/iterator qua các lần yield: nhật ký có thể được dọn)
+            log = self._change_log
+            index = bisect.bisect_right(log, since, key=lambda entry: entry[0])
+            records = []
+            while index < len(log) and len(records) < page_size:
+                seq, session_id = log[index]
+                index += 1
+                if seq > until:
+                    break
+                change = self._changes.get(session_id)
+                entry = self._sessions.get(session_id)
+                if change is None or change[0] != seq or entry is None:
+                    continue  # Mục cũ: phiên đã bị xóa hoặc đã đổi tiếp (nằm ở seq mới hơn)
+                history = entry[0]
+                child_age, profile, analyzed_at = self._profiles.get(session_id, (None, None, None))
+                records.append(_export_record(
+                    session_id, seq, change[1], len(history.messages),
+                    [(m.type, m.content) for m in history.messages] if include_messages else None,
+                    child_age, profile, analyzed_at
+                ))
+                since = seq
+            yield from records
+            if len(records) < page_size:
+                return
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "messages": self._message_total,
+            "content_chars": self._content_chars_total,
+            "trimmed_messages": self._trimmed_total,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "process_rss_bytes": _process_rss_bytes(),
+        }
+
+
+# Lịch sử chat của 1 phiên, đọc/ghi thẳng xuống SQLite (không giữ bản sao trong RAM)
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    def __init__(self, store: "SQLiteSessionStore", session_id: str):
+        self.store = store
+        self.session_id = session_id
+        self.message_ids = []  # messages.id (AUTOINCREMENT, không dùng lại) của lần đọc gần nhất
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.messages_with_ids()[0]
+
+    def messages_with_ids(self):
+        messages, self.message_ids = self.store.load_messages_with_ids(self.session_id)
+        return messages, self.message_ids
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        # Cả lượt hỏi-đáp được ghi trong 1 transaction
+        self.store.append_messages(self.session_id, messages)
+
+    # RunnableWithMessageHistory dùng 2 hàm async này: đọc/ghi SQLite trong thread, không chặn event loop
+    async def aget_messages(self) -> List[BaseMessage]:
+        return (await asyncio.to_thread(self.messages_with_ids))[0]
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        await asyncio.to_thread(self.add_messages, messages)
+
+    def clear(self) -> None:
+        self.store.delete_session(self.session_id)
+
+
+# Kho phiên chat lưu trên SQLite (chế độ WAL): dùng chung được giữa nhiều worker
+# uvicorn (--workers N) và giữ nguyên hội thoại sau khi khởi động lại.
+# Giới hạn số phiên / thời gian rảnh / số tin nhắn giống SessionStore.
+# Mọi truy vấn đều chặn (chờ khóa ghi của worker khác tới timeout=10s) -> code async phải gọi
+# qua asyncio.to_thread (blocking_io = True), trừ get_session_history không đụng tới DB.
+class SQLiteSessionStore:
+    # Khoảng cách tối thiểu giữa 2 lần dọn phiên hết hạn (giây)
+    SWEEP_INTERVAL = 30
+    blocking_io = True
+
+    def __init__(self, db_path: str, max_sessions: int = 10000, idle_ttl_seconds: float = 3600,
+                 max_messages: int = 200):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages = max_messages
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id    TEXT PRIMARY KEY,
+                last_active   REAL NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                content_chars INTEGER NOT NULL DEFAULT 0,
+                trimmed_count INTEGER NOT NULL DEFAULT 0,
+                change_seq    INTEGER NOT NULL DEFAULT 0,
+                updated_at    REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions(last_active);
+            CREATE TABLE IF NOT EXISTS messages (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+                type       TEXT NOT NULL,
+                chars      INTEGER NOT NULL,
+                data       TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+            CREATE TABLE IF NOT EXISTS profiles (
+                session_id  TEXT PRIMARY KEY REFERENCES sessions(session_id) ON DELETE CASCADE,
+                child_age   INTEGER,
+                data        TEXT NOT NULL,
+                analyzed_at REAL NOT NULL
+            );
+            -- Bộ đếm thay đổi (1 dòng, chỉ tăng): không tính theo MAX(change_seq) vì phiên giữ số lớn nhất
+            -- có thể bị xóa, số mới sẽ lùi lại và lọt khỏi các lần xuất tăng dần
+            CREATE TABLE IF NOT EXISTS change_counter (
+                id    INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            );
+        """)
+        # DB tạo từ bản cũ chưa có cột theo dõi thay đổi -> thêm vào. Giữ khóa ghi (BEGIN IMMEDIATE)
+        # khi kiểm tra + ALTER: 2 worker khởi động cùng lúc thì worker sau thấy cột đã có và bỏ qua.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+            if "change_seq" not in columns:
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN updated_at REAL")
+                # Phiên có sẵn cũng phải nằm trong lần xuất đầu tiên (since=0)
+                self._conn.execute("UPDATE sessions SET change_seq = rowid, updated_at = last_active")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_change_seq ON sessions(change_seq)")
+            self._conn.execute(
+                "INSERT OR IGNORE INTO change_counter(id, value) "
+                "SELECT 1, COALESCE(MAX(change_seq), 0) FROM sessions"
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def get_session_history(self, session_id: str) -> SQLiteChatMessageHistory:
+        # Được RunnableWithMessageHistory gọi ngay trên event loop -> không truy vấn gì ở đây.
+        # Phiên được tạo (và làm mới last_active) khi ghi tin nhắn đầu tiên trong append_messages.
+        return SQLiteChatMessageHistory(self, session_id)
+
+    def get(self, session_id: str) -> Optional[SQLiteChatMessageHistory]:
+        self._maybe_sweep()
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE sessions SET last_active = ? WHERE session_id = ? AND last_active >= ?",
+                (now, session_id, now - self.idle_ttl_seconds)
+            ).rowcount
+        if not updated:
+            return None
+        return SQLiteChatMessageHistory(self, session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def load_messages(self, session_id: str) -> List[BaseMessage]:
+        return self.load_messages_with_ids(session_id)[0]
+
+    def load_messages_with_ids(self, session_id: str):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[1]) for row in rows]), [row[0] for row in rows]
+
+    def append_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        rows = [
+            (session_id, m.type, len(str(m.content)), json.dumps(message_to_dict(m), ensure_ascii=False))
+            for m in messages
+        ]
+        if not rows:
+            return
+        self._maybe_sweep()
+        added_chars = sum(row[2] for row in rows)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO sessions(session_id, last_active) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+                    (session_id, time.time())
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages(session_id, type, chars, data) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute(
+                    "UPDATE sessions SET message_count = message_count + ?, content_chars = content_chars + ? "
+                    "WHERE session_id = ?",
+                    (len(rows), added_chars, session_id)
+                )
+                self._trim(session_id)
+                self._touch(session_id)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _touch(self, session_id: str) -> bool:
+        # Số thứ tự thay đổi lấy từ change_counter, tăng dần chung cho mọi worker (chạy trong transaction đang mở)
+        touched = self._conn.execute(
+            "UPDATE sessions SET change_seq = (SELECT value FROM change_counter WHERE id = 1) + 1, updated_at = ? "
+            "WHERE session_id = ?",
+            (time.time(), session_id)
+        ).rowcount > 0
+        if touched:
+            self._conn.execute("UPDATE change_counter SET value = value + 1 WHERE id = 1")
+        return touched
+
+    def save_profile(self, session_id: str, child_age: int, profile: dict):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._touch(session_id):  # Phiên đã bị xóa thì thôi
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO profiles(session_id, child_age, data, analyzed_at) VALUES (?, ?, ?, ?)",
+                        (session_id, child_age, json.dumps(profile, ensure_ascii=False), time.time())
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def export_cursor(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM change_counter WHERE id = 1").fetchone()[0]
+
+    def iter_changed(self, since: int, until: int, include_messages: bool = True, page_size: int = EXPORT_PAGE_SIZE):
+        """Các phiên có thay đổi trong khoảng (since, until], theo thứ tự thay đổi, đọc từng trang."""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT s.session_id, s.change_seq, s.updated_at, s.message_count, "
+                    "p.child_age, p.data, p.analyzed_at "
+                    "FROM sessions s LEFT JOIN profiles p ON p.session_id = s.session_id "
+                    "WHERE s.change_seq > ? AND s.change_seq <= ? ORDER BY s.change_seq LIMIT ?",
+                    (since, until, page_size)
+                ).fetchall()
+                messages = {}
+                if include_messages and rows:
+                    placeholders = ",".join("?" * len(rows))
+                    # Lấy nội dung bằng json_extract ngay trong SQLite, không phải dựng lại object tin nhắn
+                    for session_id, role, content in self._conn.execute(
+                        f"SELECT session_id, type, json_extract(data, '$.data.content') FROM messages "
+                        f"WHERE session_id IN ({placeholders}) ORDER BY session_id, id", [row[0] for row in rows]
+                    ):
+                        messages.setdefault(session_id, []).append((role, content))
+            for session_id, seq, updated_at, message_count, child_age, profile, analyzed_at in rows:
+                yield _export_record(
+                    session_id, seq, updated_at, message_count,
+                    messages.get(session_id, []) if include_messages else None,
+                    child_age, json.loads(profile) if profile else None, analyzed_at
+                )
+            if len(rows) < page_size:
+                return
+            since = rows[-1][1]
+
+    def _trim(self, session_id: str):
+        # Giống BoundedChatMessageHistory: bỏ các lượt cũ nhất, không để lịch sử bắt đầu bằng lời Thám tử
+        if not self.max_messages:
+            return
+        count = self._conn.execute(
+            "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+        if count <= self.max_messages:
+            return
+        rows = self._conn.execute(
+            "SELECT id, type, chars FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+        drop = len(rows) - self.max_messages
+        while drop < len(rows) and rows[drop][1] != "human":
+            drop += 1
+        last_dropped_id = rows[drop - 1][0]
+        dropped_chars = sum(row[2] for row in rows[:drop])
+        self._conn.execute("DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, last_dropped_id))
+        self._conn.execute(
+            "UPDATE sessions SET message_count = message_count - ?, content_chars = content_chars - ?, "
+            "trimmed_count = trimmed_count + ? WHERE session_id = ?",
+            (drop, dropped_chars, drop, session_id)
+        )
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.SWEEP_INTERVAL
+            self.evict_expired()
+
+    def evict_expired(self):
+        with self._lock:
+            self.evicted_idle += self._conn.execute(
+                "DELETE FROM sessions WHERE last_active < ?", (time.time() - self.idle_ttl_seconds,)
+            ).rowcount
+            # Vượt số phiên tối đa -> bỏ các phiên lâu không dùng nhất
+            self.evicted_lru += self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            ).rowcount
+
+    def stats(self):
+        with self._lock:
+            sessions, messages, content_chars, trimmed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(content_chars), 0), "
+                "COALESCE(SUM(trimmed_count), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "messages": messages,
+            "content_chars": content_chars,
+            "trimmed_messages": trimmed,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "db_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            "process_rss_bytes": _process_rss_bytes(),
+        }
+
+
+def create_session_store(backend: str = "memory", db_path: str = None, **limits):
+    # Chọn nơi lưu lịch sử chat: "memory" (mặc định, 1 worker) hoặc "sqlite" (nhiều worker, bền vững)
+    if backend == "memory":
+        return SessionStore(**limits)
+    if backend == "sqlite":
+        if not db_path:
+            raise ValueError("Cần SESSION_DB_PATH cho backend sqlite")
+        return SQLiteSessionStore(db_path, **limits)
+    raise ValueError(f"SESSION_BACKEND không hợp lệ: {backend!r} (chọn 'memory' hoặc 'sqlite')")
+
+
+def _export_record(session_id, seq, updated_at, message_count, messages, child_age, profile, analyzed_at) -> dict:
+    # 1 dòng NDJSON khi xuất dữ liệu: giống nhau cho cả 2 backend
+    record = {
+        "session_id": session_id,
+        "seq": seq,
+        "updated_at": updated_at,
+        "message_count": message_count,
+        "child_age": child_age,
+        "profile": profile,
+        "analyzed_at": analyzed_at,
+    }
+    if messages is not None:
+        record["messages"] = [{"role": role, "content": content} for role, content in messages]
+    return record
+
+
+def _process_rss_bytes():
+    # RSS hiện tại của tiến trình (Linux). Trả None nếu không đọc được.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module backend nằm phẳng trong KidTalent-Backend (không phải package) -> thêm vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,65 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from history_compaction import HistoryCompactor
+from session_store import BoundedChatMessageHistory
+
+
+def turn(human, reply):
+    return [HumanMessage(content=human), AIMessage(content=reply)]
+
+
+def make_compactor(keep_turns=1, batch_turns=2):
+    summarized = []
+
+    async def summarize(summary, new_turns):
+        summarized.append(new_turns)
+        return f"{summary} | {new_turns}".strip(" |")
+
+    return HistoryCompactor(summarize, keep_turns=keep_turns, batch_turns=batch_turns, token_budget=10000), summarized
+
+
+def compact(compactor, memory):
+    messages, ids = memory.messages_with_ids()
+    return asyncio.run(compactor.compact("bi", messages, ids))
+
+
+def test_trimmed_head_with_repeated_content_keeps_unsummarized_turns():
+    # Lượt đầu bị cắt có nội dung giống hệt lượt đầu mới -> so nội dung sẽ tưởng chưa bị cắt gì
+    memory = BoundedChatMessageHistory(max_messages=6)
+    for messages in (turn("có", "Ồ?"), turn("có", "Ồ?"), turn("Con thích vẽ khủng long", "Hay")):
+        memory.add_messages(messages)
+    compactor, summarized = make_compactor()
+    compact(compactor, memory)
+    assert len(summarized) == 1 and "khủng long" not in summarized[0]
+
+    memory.add_messages(turn("Con mới học bơi", "Giỏi quá"))
+    prompt = compact(compactor, memory)
+    assert "khủng long" in prompt
+    assert "học bơi" in prompt
+
+
+def test_only_new_turns_are_summarized():
+    memory = BoundedChatMessageHistory(max_messages=0)
+    compactor, summarized = make_compactor()
+    for n in range(1, 8):
+        memory.add_messages(turn(f"Tin số {n}", "Ồ?"))
+        compact(compactor, memory)
+    # Mỗi lượt chỉ được gộp vào tóm tắt đúng 1 lần
+    assert all(sum(f"Tin số {n}" in batch for batch in summarized) <= 1 for n in range(1, 8))
+    assert [s.count("Bé:") for s in summarized] == [2, 2, 2]
+
+
+def test_recreated_session_is_not_treated_as_summarized():
+    compactor, summarized = make_compactor()
+    memory = BoundedChatMessageHistory()
+    for n in range(3):
+        memory.add_messages(turn("có", "Ồ?"))
+    compact(compactor, memory)
+    # Phiên bị xóa rồi tạo lại với cùng nội dung: các lượt cũ phải được gộp lại từ đầu
+    recreated = BoundedChatMessageHistory()
+    for n in range(3):
+        recreated.add_messages(turn("có", "Ồ?"))
+    compact(compactor, recreated)
+    assert len(summarized) == 2
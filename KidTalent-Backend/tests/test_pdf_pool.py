@@ -0,0 +1,32 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from pdf_pool import PdfRenderPool
+
+
+def crash(_):
+    os._exit(1)  # Giống worker bị OOM kill / segfault
+
+
+def echo(payload):
+    return payload
+
+
+def test_pool_recovers_after_worker_dies():
+    pool = PdfRenderPool(max_workers=1, kind="process")
+
+    async def run():
+        with pytest.raises(BrokenProcessPool):
+            await pool._submit(crash, None)
+        # Pool hỏng đã bị bỏ -> việc tiếp theo chạy trên pool mới
+        assert await pool._submit(echo, b"%PDF") == b"%PDF"
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    stats = pool.stats()
+    assert (stats["broken"], stats["completed"], stats["pending"]) == (1, 1, 0)
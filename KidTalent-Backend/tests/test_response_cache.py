@@ -0,0 +1,21 @@
+import asyncio
+
+from response_cache import ResponseCache
+
+
+def test_async_tiers_share_replies_between_workers(tmp_path):
+    db_path = str(tmp_path / "response_cache.db")
+    worker_1 = ResponseCache(db_path=db_path)
+    worker_2 = ResponseCache(db_path=db_path)
+    key = worker_1.key(8, [], "Chào Thám tử!")
+
+    async def run():
+        assert await worker_2.aget(key) is None
+        await worker_1.aput(key, "Chào bé!", llm_seconds=0.5)
+        # Worker 2 chưa có trong RAM -> đọc từ SQLite rồi giữ lại trong RAM
+        assert await worker_2.aget(key) == "Chào bé!"
+        assert await worker_2.aget(key) == "Chào bé!"
+
+    asyncio.run(run())
+    stats = worker_2.stats()
+    assert (stats["hits"], stats["db_hits"], stats["misses"]) == (2, 1, 1)
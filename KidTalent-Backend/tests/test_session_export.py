@@ -0,0 +1,74 @@
+from langchain_core.messages import HumanMessage
+
+from session_store import SessionStore, SQLiteSessionStore
+
+
+def chat(store, session_id, text="Con thích vẽ khủng long"):
+    store.get_session_history(session_id).add_messages([HumanMessage(content=text)])
+
+
+def exported(store, since=0, page_size=3):
+    return [(r["session_id"], r["seq"]) for r in store.iter_changed(since, store.export_cursor(), page_size=page_size)]
+
+
+def test_pages_cover_every_session_once():
+    store = SessionStore()
+    for n in range(10):
+        chat(store, f"kid-{n}")
+    assert exported(store) == [(f"kid-{n}", n + 1) for n in range(10)]
+
+
+def test_incremental_export_skips_superseded_changes():
+    store = SessionStore()
+    for n in range(5):
+        chat(store, f"kid-{n}")
+    cursor = store.export_cursor()
+    chat(store, "kid-1")
+    chat(store, "kid-3")
+    chat(store, "kid-1")
+    store.save_profile("kid-4", 8, {"summary": "Bé thích vẽ"})
+    # kid-1 đổi 2 lần nhưng chỉ xuất 1 dòng, ở lần đổi mới nhất
+    assert exported(store, since=cursor) == [("kid-3", 7), ("kid-1", 8), ("kid-4", 9)]
+
+
+def test_until_bounds_the_export():
+    store = SessionStore()
+    for n in range(4):
+        chat(store, f"kid-{n}")
+    until = store.export_cursor()
+    chat(store, "kid-0")
+    chat(store, "kid-9")
+    records = list(store.iter_changed(0, until, page_size=2))
+    assert [r["session_id"] for r in records] == ["kid-1", "kid-2", "kid-3"]
+
+
+def test_compacted_log_after_many_changes():
+    store = SessionStore(max_sessions=3)
+    for n in range(2000):
+        chat(store, f"kid-{n % 5}")
+    # Nhật ký được dọn, không tăng theo tổng số lần thay đổi
+    assert len(store._change_log) <= 2 * len(store._changes) + 1024
+    assert [sid for sid, _ in exported(store)] == ["kid-2", "kid-3", "kid-4"]
+
+
+def test_history_changed_after_eviction_is_not_exported():
+    store = SessionStore(max_sessions=1)
+    kept = store.get_session_history("A")
+    chat(store, "B")  # A bị đẩy ra (LRU) trong lúc lượt chat của A vẫn đang giữ history
+    kept.add_messages([HumanMessage(content="Con vẫn ở đây")])
+    assert exported(store) == [("B", 1)]
+
+
+def test_sqlite_sequence_never_goes_backwards(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    for session_id in ("a", "b", "c"):
+        store.append_messages(session_id, [HumanMessage(content="Con thích vẽ")])
+    store.save_profile("c", 8, {"summary": "Bé thích vẽ"})
+    cursor = store.export_cursor()
+    # Xóa phiên đang giữ số thứ tự lớn nhất: phiên mới vẫn phải nằm sau con trỏ cũ
+    store.delete_session("c")
+    store.append_messages("d", [HumanMessage(content="Con mới học bơi")])
+    assert [r["session_id"] for r in store.iter_changed(cursor, store.export_cursor())] == ["d"]
+    # Mở lại DB (worker khác / khởi động lại) vẫn tiếp tục từ bộ đếm cũ
+    reopened = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    assert reopened.export_cursor() == store.export_cursor()
@@ -0,0 +1,37 @@
+import random
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from session_store import SessionStore
+
+
+def recount(store):
+    histories = [history for history, _ in store._sessions.values()]
+    return {
+        "messages": sum(len(h.messages) for h in histories),
+        "content_chars": sum(h.content_chars for h in histories),
+        "trimmed_messages": sum(h.trimmed_count for h in histories),
+    }
+
+
+def test_stats_counters_match_stored_sessions():
+    # stats() không duyệt _sessions (chạy trong threadpool) -> tổng cộng dồn phải luôn khớp
+    rng = random.Random(11)
+    store = SessionStore(max_sessions=5, max_messages=6)
+    in_flight = []
+    for _ in range(3000):
+        session_id = f"kid-{rng.randrange(8)}"
+        action = rng.random()
+        if action < 0.1:
+            store.get_session_history(session_id).clear()
+        elif action < 0.2:
+            # Lượt chat đang chạy vẫn ghi vào history của phiên có thể đã bị đẩy ra
+            in_flight.append(store.get_session_history(session_id))
+        elif action < 0.3 and in_flight:
+            in_flight.pop(rng.randrange(len(in_flight))).add_messages([HumanMessage(content="muộn")])
+        else:
+            store.get_session_history(session_id).add_messages(
+                [HumanMessage(content="có" * rng.randint(1, 5)), AIMessage(content="Ồ?")]
+            )
+        stats = store.stats()
+        assert {key: stats[key] for key in ("messages", "content_chars", "trimmed_messages")} == recount(store)
@@ -0,0 +1,109 @@
+import random
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from session_store import BoundedChatMessageHistory
+from transcript import Transcript, TranscriptCache, render_message
+
+
+def rebuilt_text(messages):
+    return "".join(render_message(m) + "\n" for m in messages)
+
+
+def turn(n, reply="Hay quá! Kể thêm cho Thám tử nghe nào."):
+    return [HumanMessage(content=f"Tin nhắn số {n}"), AIMessage(content=reply)]
+
+
+def history(*turns, max_messages=0):
+    memory = BoundedChatMessageHistory(max_messages=max_messages)
+    for messages in turns:
+        memory.add_messages(messages)
+    return memory
+
+
+def sync(transcript, memory):
+    return transcript.sync(*memory.messages_with_ids())
+
+
+def test_append_is_incremental():
+    memory = history(turn(1), turn(2))
+    transcript = Transcript()
+    assert sync(transcript, memory) is False
+    memory.add_messages(turn(3))
+    assert sync(transcript, memory) is False
+    assert transcript.text == rebuilt_text(memory.messages)
+    assert transcript.message_count == 6
+
+
+def test_trim_at_front_then_append():
+    memory = history(turn(1), turn(2), turn(3), max_messages=6)
+    transcript = Transcript()
+    sync(transcript, memory)
+    # Lịch sử bị cắt 1 lượt ở đầu và có thêm 1 lượt mới
+    memory.add_messages(turn(4))
+    assert sync(transcript, memory) is False
+    assert transcript.text == rebuilt_text(memory.messages)
+    assert transcript.char_count == len(transcript.text)
+
+
+def test_repeated_reply_does_not_force_rebuild():
+    # Mọi câu trả lời của Thám tử giống hệt nhau
+    memory = history(turn(1), turn(2), turn(3), turn(4), max_messages=8)
+    transcript = Transcript()
+    sync(transcript, memory)
+    memory.add_messages(turn(5))
+    assert sync(transcript, memory) is False
+    assert transcript.text == rebuilt_text(memory.messages)
+
+
+def test_repeated_content_across_trim_boundary():
+    # 2 lượt mới đẩy 2 lượt cũ ra ngoài; tin đầu, tin giữa, tin cuối đều trùng nội dung với bản cũ
+    # -> so nội dung sẽ tưởng lịch sử không đổi, transcript và fingerprint bị giữ nguyên
+    yes = [HumanMessage(content="có"), AIMessage(content="Ồ?")]
+    memory = history(yes, yes, max_messages=4)
+    transcript = Transcript()
+    sync(transcript, memory)
+    before = transcript.fingerprint
+    memory.add_messages(yes)
+    memory.add_messages([HumanMessage(content="dạ"), AIMessage(content="Ồ?")])
+    assert sync(transcript, memory) is False
+    assert transcript.text == rebuilt_text(memory.messages)
+    assert transcript.fingerprint != before
+
+
+def test_random_short_repeated_messages():
+    rng = random.Random(9)
+    words = ["có", "dạ", "không", "Ồ?", "Hay quá!"]
+    memory = BoundedChatMessageHistory(max_messages=20)
+    transcript = Transcript()
+    for _ in range(2000):
+        for _ in range(rng.randint(1, 2)):
+            memory.add_messages([HumanMessage(content=rng.choice(words)), AIMessage(content=rng.choice(words))])
+        assert sync(transcript, memory) is False
+        assert transcript.text == rebuilt_text(memory.messages)
+
+
+def test_clear_and_recreated_session_rebuild():
+    memory = history(turn(1), turn(2))
+    transcript = Transcript()
+    sync(transcript, memory)
+    memory.clear()
+    memory.add_messages(turn(1))
+    sync(transcript, memory)
+    assert transcript.text == rebuilt_text(turn(1))
+    # Phiên bị xóa rồi tạo lại cùng session_id, cùng nội dung
+    recreated = history(turn(1), turn(2))
+    sync(transcript, recreated)
+    assert transcript.text == rebuilt_text(recreated.messages)
+
+
+def test_cache_counts_rebuilds_only():
+    cache = TranscriptCache()
+    memory = history(turn(1), turn(2), turn(3), max_messages=6)
+    cache.get("bi", *memory.messages_with_ids())
+    memory.add_messages(turn(4))
+    cache.get("bi", *memory.messages_with_ids())
+    assert cache.stats()["rebuilds"] == 0
+    # Mã vị trí không khớp với những gì đã dựng -> dựng lại
+    assert cache.get("bi", turn(9), [(0, 0), (0, 1)]).text == rebuilt_text(turn(9))
+    assert cache.stats()["rebuilds"] == 1
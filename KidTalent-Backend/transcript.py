@@ -0,0 +1,108 @@
+import bisect
+import hashlib
+from collections import OrderedDict, deque
+
+
+def render_message(message) -> str:
+    role = "Bé" if message.type == "human" else "Thám tử"
+    return f"{role}: {message.content}"
+
+
+# Bản text của 1 cuộc trò chuyện, dựng dần theo từng tin nhắn mới
+class Transcript:
+    def __init__(self):
+        self._lines = deque()
+        self._ids = deque()  # Mã vị trí (do kho phiên cấp) của tin nhắn ứng với từng dòng
+        self.char_count = 0
+        self._text = None
+        self._fingerprint = None
+
+    @property
+    def message_count(self) -> int:
+        return len(self._lines)
+
+    @property
+    def text(self) -> str:
+        # Chỉ nối chuỗi lại khi nội dung thay đổi
+        if self._text is None:
+            self._text = "".join(line + "\n" for line in self._lines)
+        return self._text
+
+    @property
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def _append(self, messages, ids):
+        for message, message_id in zip(messages, ids):
+            line = render_message(message)
+            self._lines.append(line)
+            self._ids.append(message_id)
+            self.char_count += len(line) + 1
+        self._changed()
+
+    def _drop_front(self, count: int):
+        for _ in range(count):
+            self.char_count -= len(self._lines.popleft()) + 1
+            self._ids.popleft()
+        self._changed()
+
+    def _reset(self):
+        self._lines.clear()
+        self._ids.clear()
+        self.char_count = 0
+        self._changed()
+
+    def _changed(self):
+        self._text = None
+        self._fingerprint = None
+
+    def sync(self, messages, ids) -> bool:
+        """Đồng bộ với danh sách tin nhắn hiện tại; ids: mã vị trí tăng dần của từng tin (message_ids của history).
+        Trả về True nếu phải dựng lại từ đầu."""
+        if not messages:
+            if self._ids:
+                self._reset()
+            return False
+
+        # Lịch sử chỉ bị cắt ở đầu và mã không bao giờ dùng lại (không so nội dung: bé hay nhắn "có", "dạ",
+        # Thám tử hay lặp câu trả lời): bỏ các dòng có mã nhỏ hơn tin đầu hiện tại, phần còn lại phải là
+        # đúng các tin đầu danh sách mới, sau đó chỉ nối thêm phần mới.
+        dropped = bisect.bisect_left(self._ids, ids[0])
+        kept = len(self._ids) - dropped
+        if kept > len(messages) or (kept and (self._ids[dropped] != ids[0] or self._ids[-1] != ids[kept - 1])):
+            self._reset()
+            self._append(messages, ids)
+            return True
+
+        if dropped:
+            self._drop_front(dropped)
+        if kept < len(messages):
+            self._append(messages[kept:], ids[kept:])
+        return False
+
+
+# Giữ transcript đã dựng cho từng phiên để /analyze, /report không phải nối chuỗi lại từ đầu
+class TranscriptCache:
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._transcripts = OrderedDict()
+        self.rebuilds = 0
+
+    def get(self, session_id: str, messages, ids) -> Transcript:
+        transcript = self._transcripts.get(session_id)
+        if transcript is None:
+            transcript = self._transcripts[session_id] = Transcript()
+            while len(self._transcripts) > self.max_sessions:
+                self._transcripts.popitem(last=False)
+        self._transcripts.move_to_end(session_id)
+        if transcript.sync(messages, ids):
+            self.rebuilds += 1
+        return transcript
+
+    def stats(self):
+        return {
+            "sessions": len(self._transcripts),
+            "rebuilds": self.rebuilds,
+        }
@@ -1,7 +1,7 @@
 import streamlit as st
-import requests
 import uuid  # Để tạo mã định danh cho từng bé (Session ID)
 import os
+from backend_client import BackendError, get_backend_client
 # 1. Cấu hình trang web
 st.set_page_config(page_title="Thám tử Gà Mơ 🐔", page_icon="🕵️‍♂️")
 
@@ -9,9 +9,13 @@ st.title("🕵️‍♂️ Thám tử Gà Mơ - Khám phá Tài năng")
 st.write("Chào bạn nhỏ! Hãy kể cho Thám tử nghe về sở thích của bạn nhé!")
 
 # 2. Kết nối với Backend (QUAN TRỌNG)
-BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
-CHAT_URL = f"{BASE_URL}/chat"
-ANALYZE_URL = f"{BASE_URL}/analyze"
+# Client dùng chung 1 Session có pool kết nối + timeout (xem backend_client.py)
+backend = get_backend_client()
+CHILD_AGE = 8  # Tạm để cứng, sau này có thể làm ô nhập tuổi
+# Bật/tắt chế độ hiện chữ dần (stream) cho câu trả lời của Thám tử
+USE_STREAMING = os.getenv("CHAT_STREAMING", "1") == "1"
+# Hiện bảng độ trễ từng lời gọi Backend ở sidebar (chỉ khi dev, đặt FRONTEND_DEBUG=1)
+SHOW_DEBUG = os.getenv("FRONTEND_DEBUG", "0") == "1"
 
 # 3. Quản lý Lịch sử Chat & Session ID
 if "session_id" not in st.session_state:
@@ -39,26 +43,22 @@ if user_input := st.chat_input("Nhập câu trả lời của bé vào đây..."
 
     # Gửi sang Backend để AI suy nghĩ
     with st.chat_message("assistant", avatar="🐔"):
-        with st.spinner("Thám tử đang suy nghĩ..."):
-            try:
-                # Gửi gói tin JSON sang API
-                payload = {
-                    "session_id": st.session_state.session_id,
-                    "user_message": user_input,
-                    "child_age": 8  # Tạm để cứng, sau này có thể làm ô nhập tuổi
-                }
-                response = requests.post(CHAT_URL, json=payload)
-
-                if response.status_code == 200:
-                    ai_reply = response.json()["ai_reply"]
-                    st.write(ai_reply)
-
-                    # Lưu lời AI vào lịch sử
-                    st.session_state.messages.append({"role": "assistant", "content": ai_reply})
-                else:
-                    st.error("Thám tử bị mất kết nối với tổng hành dinh! 😭")
-
-            except Exception as e:
+        try:
+            if USE_STREAMING:
+                # Hiện từng chữ ngay khi Thám tử "nói", không phải chờ cả câu
+                ai_reply = st.write_stream(backend.stream_chat(st.session_state.session_id, user_input, CHILD_AGE))
+            else:
+                with st.spinner("Thám tử đang suy nghĩ..."):
+                    ai_reply = backend.chat(st.session_state.session_id, user_input, CHILD_AGE)
+                st.write(ai_reply)
+
+            # Lưu lời AI vào lịch sử
+            st.session_state.messages.append({"role": "assistant", "content": ai_reply})
+
+        except BackendError as e:
+            if e.status_code == 503:
+                st.error(f"Thám tử bị mất kết nối với tổng hành dinh! 😭 {e}")
+            else:
                 st.error(f"Lỗi kết nối: {e}")
                 st.info("Gợi ý: Bạn đã chạy Backend (Docker/Uvicorn) chưa?")
 
@@ -70,59 +70,54 @@ with st.sidebar:
     if st.button("🔍 Phân tích Tài năng ngay"):
         with st.spinner("Chuyên gia đang đánh giá hồ sơ..."):
             try:
-                payload = {
-                    "session_id": st.session_state.session_id,
-                    "child_age": 8  # (Sau này lấy từ input)
-                }
-                response = requests.post(ANALYZE_URL, json=payload)
-
-                if response.status_code == 200:
-                    data = response.json()
-
-                    if "error" in data:
-                        st.error(data["error"])
-                    else:
-                        # Hiển thị kết quả đẹp mắt
-                        st.success("Đã phân tích xong!")
-                        st.markdown("### 📊 Báo cáo Tài năng")
-
-                        st.write(f"**📝 Tóm tắt:** {data['summary']}")
-                        st.write(f"**🧠 Trí thông minh nổi trội:** {data['dominant_intelligence']}")
-
-                        st.write("**✨ Tính cách:**")
-                        for trait in data['personality_traits']:
-                            st.write(f"- {trait}")
-
-                        st.write("**🚀 Nghề nghiệp gợi ý:**")
-                        for job in data['suggested_careers']:
-                            st.write(f"- {job}")
-
-                        st.info(f"**💡 Lời khuyên:** {data['advice_for_parents']}")
-
-                        # --- [NEW] NÚT TẢI PDF ---
-                        st.markdown("---")
-                        st.write("📥 **Lưu trữ hồ sơ:**")
-
-                        # Logic: Frontend gọi API /report -> Nhận file binary -> Tạo nút download
-                        REPORT_URL = f"{BASE_URL}/report"
-
-                        try:
-                            pdf_response = requests.post(REPORT_URL, json=payload)
-
-                            if pdf_response.status_code == 200 and "application/pdf" in pdf_response.headers.get("Content-Type", ""):
-                                st.download_button(
-                                    label="📄 Nhấn vào đây để tải Báo cáo PDF (Bản đẹp)",
-                                    data=pdf_response.content,
-                                    file_name=f"Ho_So_Tai_Nang_{st.session_state.session_id}.pdf",
-                                    mime="application/pdf"
-                                )
-                                # st.balloons() # Có thể bỏ qua hoặc để lại tùy ý
-                            else:
-                                st.error("Lỗi: Server không thể tạo file PDF hợp lệ.")
-                        except Exception as e:
-                            st.error(f"Lỗi khi chuẩn bị file PDF: {e}")
-
+                data = backend.analyze(st.session_state.session_id, CHILD_AGE)
+                if "error" in data:
+                    st.error(data["error"])
                 else:
-                    st.error("Lỗi kết nối server phân tích.")
-            except Exception as e:
-                st.error(f"Lỗi: {e}")
\ No newline at end of file
+                    # Lưu lại để kết quả không biến mất khi Streamlit chạy lại script
+                    st.session_state.analysis = {"session_id": st.session_state.session_id, **data}
+            except BackendError as e:
+                st.error(f"Lỗi: {e}")
+
+    data = st.session_state.get("analysis")
+    if data and data["session_id"] == st.session_state.session_id:
+        # Hiển thị kết quả đẹp mắt
+        st.success("Đã phân tích xong!")
+        st.markdown("### 📊 Báo cáo Tài năng")
+
+        st.write(f"**📝 Tóm tắt:** {data['summary']}")
+        st.write(f"**🧠 Trí thông minh nổi trội:** {data['dominant_intelligence']}")
+
+        st.write("**✨ Tính cách:**")
+        for trait in data['personality_traits']:
+            st.write(f"- {trait}")
+
+        st.write("**🚀 Nghề nghiệp gợi ý:**")
+        for job in data['suggested_careers']:
+            st.write(f"- {job}")
+
+        st.info(f"**💡 Lời khuyên:** {data['advice_for_parents']}")
+
+        # --- NÚT TẢI PDF ---
+        st.markdown("---")
+        st.write("📥 **Lưu trữ hồ sơ:**")
+
+        # Logic: chỉ khi phụ huynh bấm tải mới tạo job /reports -> chờ xong -> tải file PDF
+        session_id = st.session_state.session_id
+
+        st.download_button(
+            label="📄 Nhấn vào đây để tải Báo cáo PDF (Bản đẹp)",
+            data=lambda: backend.fetch_report_pdf(session_id, CHILD_AGE),
+            file_name=f"Ho_So_Tai_Nang_{session_id}.pdf",
+            mime="application/pdf",
+            on_click="ignore"
+        )
+
+    if SHOW_DEBUG:
+        # Bảng debug: độ trễ từng lời gọi Backend trong phiên này (mới nhất ở trên)
+        with st.expander("🛠️ Debug: độ trễ gọi Backend"):
+            calls = st.session_state.get("backend_calls", [])
+            if calls:
+                st.dataframe(list(reversed(calls)), hide_index=True)
+            else:
+                st.caption("Chưa có lời gọi nào.")
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# Kết nối tới Backend: địa chỉ, thời gian chờ kết nối / chờ đọc dữ liệu (giây), số kết nối giữ sẵn
+BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "60"))
+POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "10"))
+# Chờ job tạo PDF tối đa bao lâu khi phụ huynh bấm tải (giây)
+REPORT_WAIT_SECONDS = float(os.getenv("REPORT_WAIT_SECONDS", "90"))
+# Số lời gọi gần nhất hiện trong bảng debug
+DEBUG_HISTORY = 30
+
+
+class BackendError(Exception):
+    """Backend trả lỗi (HTTP >= 400) hoặc không kết nối được."""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def record_call(endpoint: str, status, started: float, **extra):
+    # Lưu độ trễ từng lời gọi vào phiên Streamlit của người dùng (cho bảng debug)
+    entry = {"endpoint": endpoint, "status": status, "ms": round((time.perf_counter() - started) * 1000, 1), **extra}
+    try:
+        calls = st.session_state.setdefault("backend_calls", [])
+    except Exception:  # Ngoài phiên Streamlit (vd. chạy thử bằng python)
+        return
+    calls.append(entry)
+    del calls[:-DEBUG_HISTORY]
+
+
+def _error_message(response) -> str:
+    try:
+        body = response.json()
+    except ValueError:
+        return f"HTTP {response.status_code}"
+    message = body.get("detail") or body.get("error") or f"HTTP {response.status_code}"
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        message += f" (thử lại sau {retry_after} giây)"
+    return message
+
+
+# 1 Session dùng chung (keep-alive, pool kết nối) cho mọi lượt chạy lại của Streamlit
+class BackendClient:
+    def __init__(self, base_url: str = BASE_URL, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, pool_size: int = POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            record_call(f"{method} {path}", "lỗi", started)
+            raise BackendError(f"Không kết nối được Backend: {e}") from e
+        record_call(f"{method} {path}", response.status_code, started)
+        if response.status_code >= 400:
+            raise BackendError(_error_message(response), response.status_code)
+        return response
+
+    def chat(self, session_id: str, message: str, age: int) -> str:
+        payload = {"session_id": session_id, "user_message": message, "child_age": age}
+        return self._request("POST", "/chat", json=payload).json()["ai_reply"]
+
+    def stream_chat(self, session_id: str, message: str, age: int):
+        """Đọc các sự kiện SSE từ /chat/stream và trả về từng token ngay khi nhận được."""
+        payload = {"session_id": session_id, "user_message": message, "child_age": age}
+        started = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.base_url}/chat/stream", json=payload, stream=True,
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            record_call("POST /chat/stream", "lỗi", started)
+            raise BackendError(f"Không kết nối được Backend: {e}") from e
+
+        with response:
+            if response.status_code >= 400:
+                record_call("POST /chat/stream", response.status_code, started)
+                raise BackendError(_error_message(response), response.status_code)
+            event = None
+            ttft_ms = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = None
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "error":
+                        record_call("POST /chat/stream", "lỗi", started, ttft_ms=ttft_ms)
+                        raise BackendError(data["error"])
+                    if event == "done":
+                        record_call("POST /chat/stream", response.status_code, started, ttft_ms=ttft_ms,
+                                    cached=data.get("cached", False))
+                        return
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                    yield data["token"]
+
+    def analyze(self, session_id: str, age: int) -> dict:
+        return self._request("POST", "/analyze", json={"session_id": session_id, "child_age": age}).json()
+
+    def fetch_report_pdf(self, session_id: str, age: int, child_name: str = None) -> bytes:
+        # Tạo job báo cáo, chờ tới khi xong rồi mới tải PDF (chỉ gọi khi phụ huynh bấm tải)
+        job = self._request("POST", "/reports", json={
+            "session_id": session_id, "child_age": age, "child_name": child_name
+        }).json()
+        deadline = time.monotonic() + REPORT_WAIT_SECONDS
+        delay = 0.2
+        while job["status"] in ("queued", "running"):
+            if time.monotonic() > deadline:
+                raise BackendError("Báo cáo tạo quá lâu, vui lòng thử lại sau.")
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2.0)
+            job = self._request("GET", job["status_url"]).json()
+        if job["status"] != "done":
+            raise BackendError(job.get("error") or "Không tạo được báo cáo.")
+        return self._request("GET", job["pdf_url"]).content
+
+
+@st.cache_resource
+def get_backend_client() -> BackendClient:
+    # Tạo 1 lần cho cả tiến trình Streamlit (không tạo lại mỗi lần script chạy lại)
+    return BackendClient()